@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Apple Passwords -> Bitwarden converter.
+
+Generates a synthetic Apple Passwords CSV export and reports:
+- end-to-end convert() throughput (rows/sec) and peak RSS
+- per-stage timings for the hot-path helpers (norm, guess_name,
+  looks_like_url_or_domain) and the Bitwarden writer
+- a micro-benchmark of the compiled/cached helpers against their uncompiled versions
+- the fast hostname extractor against urlparse (--check also verifies they agree)
+- header mapping cost per file: original build_field_map(), the alias index, and the
+  signature cache
+- with --dedupe-memory, time and peak RSS of the in-memory vs disk-backed dedupe index
+
+Usage:
+    python3 bench.py --rows 200000 --variant 1 --urlless-ratio 0.3 --no-bom
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import random
+import re
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+from urllib.parse import urlparse
+
+import main as converter
+
+DOMAINS = [
+    "google.com",
+    "apple.com",
+    "github.com",
+    "sso.corp.example.com",
+    "login.microsoftonline.com",
+    "amazon.co.uk",
+    "bank.example.org",
+    "mail.yahoo.co.jp",
+]
+NAMES = ["Google", "Apple ID", "GitHub", "Corporate SSO", "Outlook", "Amazon", "Bank", "Mail"]
+FOLDERS = ["", "", "", "Work", "Personal", "Finance"]
+
+
+def header_variant(variant: int) -> list[str]:
+    """Pick the variant-th alias (clamped) of every field in converter.FIELD_CANDIDATES."""
+    return [names[min(variant, len(names) - 1)] for names in converter.FIELD_CANDIDATES.values()]
+
+
+def generate_apple_csv(
+    path: str,
+    rows: int = 10_000,
+    variant: int = 0,
+    urlless_ratio: float = 0.2,
+    bom: bool = True,
+    multiline_ratio: float = 0.1,
+    seed: int = 0,
+    dup_ratio: float = 0.0,
+) -> None:
+    """
+    Write a synthetic Apple Passwords export with `rows` records to path. dup_ratio
+    of the rows repeat the domain, username and password of a recent earlier row.
+    """
+    rnd = random.Random(seed)
+    recent: list[tuple[str, str, str]] = []
+    alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
+
+    with open(path, "w", encoding="utf-8-sig" if bom else "utf-8", newline="") as f:
+        w = csv.writer(f)
+        # Columns follow FIELD_CANDIDATES order: title,url,username,password,notes,totp,folder,favorite
+        w.writerow(header_variant(variant))
+        for i in range(rows):
+            domain = rnd.choice(DOMAINS)
+            if rnd.random() < urlless_ratio:
+                # Title only; half of them are a bare domain that gets promoted to the URL
+                title = domain if rnd.random() < 0.5 else rnd.choice(NAMES)
+                url = ""
+            else:
+                title = rnd.choice(NAMES) if rnd.random() < 0.5 else ""
+                # Most saved URLs are just the site root; some carry a unique path
+                url = f"https://{domain}/" if rnd.random() < 0.7 else f"https://{domain}/login?id={i}"
+            username = f"user{i}@example.com"
+            password = "".join(rnd.choice(alphabet) for _ in range(16))
+            if recent and rnd.random() < dup_ratio:
+                domain, username, password = rnd.choice(recent)
+                title, url = rnd.choice(NAMES), f"https://{domain}/"
+            elif len(recent) < 1000:
+                recent.append((domain, username, password))
+            else:
+                recent[i % 1000] = (domain, username, password)
+            if rnd.random() < multiline_ratio:
+                notes = f"Recovery codes:\n{rnd.randrange(10**8):08d}\n{rnd.randrange(10**8):08d}"
+            else:
+                notes = ""
+            totp = f"otpauth://totp/{domain}:{username}?secret=JBSWY3DPEHPK3PXP" if i % 10 == 0 else ""
+            favorite = "Yes" if i % 25 == 0 else ""
+            w.writerow([title, url, username, password, notes, totp, rnd.choice(FOLDERS), favorite])
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process in MiB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss / (1024 * 1024) if os.uname().sysname == "Darwin" else rss / 1024
+
+
+def run_cli(argv: list[str]) -> tuple[float, float | None]:
+    """Wall seconds and peak RSS (MiB, None where unsupported) of main.py in a fresh process."""
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, main_path, *argv], stdout=subprocess.DEVNULL)
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return time.perf_counter() - start, None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    secs = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(f"main.py {' '.join(argv)} exited with {proc.returncode}")
+    rss = usage.ru_maxrss
+    return secs, rss / (1024 * 1024) if os.uname().sysname == "Darwin" else rss / 1024
+
+
+def bench_dedupe(in_path: str, max_memory: str) -> dict[str, tuple[float, float | None]]:
+    """(seconds, peak RSS MiB) of --dedupe drop with the in-memory and the disk-backed index."""
+    out_path = in_path + ".dedupe.csv"
+    try:
+        return {
+            "memory index": run_cli([in_path, "-o", out_path, "--dedupe", "drop"]),
+            f"disk index ({max_memory})": run_cli(
+                [in_path, "-o", out_path, "--dedupe", "drop", "--dedupe-memory", max_memory]
+            ),
+        }
+    finally:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+
+
+def time_calls(fn: Callable, args_list: list[tuple]) -> float:
+    """Total seconds spent calling fn(*args) for every args tuple."""
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return time.perf_counter() - start
+
+
+def bench_convert(in_path: str, repeat: int = 3) -> float:
+    """Best-of-repeat seconds for a full convert() of in_path."""
+    out_path = in_path + ".out.csv"
+    best = float("inf")
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            converter.convert(in_path, out_path)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+    return best
+
+
+def bench_stages(in_path: str, write_path: str = os.devnull) -> dict[str, float]:
+    """
+    Seconds spent in each hot-path helper over every row of in_path. The writer
+    timings write to write_path (e.g. a file on a network filesystem).
+    """
+    records = list(converter.iter_apple_rows(in_path))
+    headers, data = records[0], records[1:]
+    field_map = converter.build_field_map(headers)
+    indices = dict(zip(converter.APPLE_FIELDS, converter.resolve_field_indices(headers, field_map)))
+
+    def column(key: str) -> list[str]:
+        i = indices[key]
+        return [r[i] if 0 <= i < len(r) else "" for r in data]
+
+    titles = column("title")
+    pairs = list(zip(titles, column("url")))
+    titles = [(t,) for t in titles]
+    favorites = [(v,) for v in column("favorite")]
+    bw_rows = list(converter.map_to_bitwarden(records))
+
+    return {
+        "read": time_calls(lambda: sum(1 for _ in converter.iter_apple_rows(in_path)), [()]),
+        "read (mmap)": time_calls(lambda: sum(1 for _ in converter.iter_apple_rows_mmap(in_path)), [()]),
+        "norm": time_calls(converter.norm, favorites),
+        "guess_name": time_calls(converter.guess_name, pairs),
+        "looks_like_url_or_domain": time_calls(converter.looks_like_url_or_domain, titles),
+        "writer": time_calls(converter.write_bitwarden, [(bw_rows, write_path)]),
+        "writer (8M buffer)": time_calls(
+            converter.write_bitwarden, [(bw_rows, write_path, 8 * 1024**2)]
+        ),
+    }
+
+
+# Reference versions of the helpers as they were before compiled patterns / caching.
+def _norm_uncached(s: str) -> str:
+    return re.sub(r"[\s_\-]+", "", (s or "").strip().lower())
+
+
+def _to_bool_favorite_uncached(val: str) -> str:
+    v = _norm_uncached(val)
+    return "1" if v in {"1", "true", "yes", "y", "on"} else ""
+
+
+def _looks_like_url_or_domain_uncached(s: str) -> bool:
+    s = converter.safe_strip(s)
+    if not s:
+        return False
+    return bool(
+        re.match(r"^(https?://)", s, re.I)
+        or re.match(r"^[a-z0-9.-]+\.[a-z]{2,}(/.*)?$", s, re.I)
+    )
+
+
+def _hostname_urlparse(u: str) -> str:
+    try:
+        p = urlparse(u if "://" in u else "https://" + u)
+        host = converter.safe_strip(p.hostname)
+        return host or u
+    except Exception:
+        return u
+
+
+URL_PIECES = [
+    "http", "https", "HTTPS", "ftp", "://", ":", "/", "//", "?", "#", "@", "[", "]", "::1",
+    ".", "-", "_", "+", "example", "Example.COM", "co.uk", "8080", "443", "user", "pw",
+    " ", "\t", "\n", "é", "%20", "xn--bcher-kva", "a", "1", "=", "&",
+]
+
+
+def check_hostname_equivalence(samples: int = 200_000, seed: int = 0) -> int:
+    """
+    Property check: the fast hostname path must agree with plain urlparse on random
+    URL-shaped strings. Returns the number of fast-path hits; raises AssertionError
+    on the first mismatch.
+    """
+    rnd = random.Random(seed)
+    fast_hits = 0
+    for _ in range(samples):
+        u = "".join(rnd.choice(URL_PIECES) for _ in range(rnd.randint(1, 8))).strip()
+        if not u:
+            continue
+        if converter._fast_hostname(u) is not None:
+            fast_hits += 1
+        expected = _hostname_urlparse(u)
+        got = converter._parse_hostname(u)
+        assert got == expected, f"{u!r}: fast path gave {got!r}, urlparse gave {expected!r}"
+    return fast_hits
+
+
+def bench_hostname(in_path: str) -> tuple[float, float]:
+    """Per-call microseconds (urlparse, fast path) for the URLs of in_path, uncached."""
+    records = list(converter.iter_apple_rows(in_path))
+    headers, data = records[0], records[1:]
+    field_map = converter.build_field_map(headers)
+    ui = converter.resolve_field_indices(headers, field_map)[converter.APPLE_FIELDS.index("url")]
+    urls = [(r[ui],) for r in data if ui >= 0 and r[ui]]
+    n = max(len(urls), 1)
+    before = min(time_calls(_hostname_urlparse, urls) for _ in range(3)) / n * 1e6
+    after = min(time_calls(converter._parse_hostname, urls) for _ in range(3)) / n * 1e6
+    return before, after
+
+
+def _build_field_map_reference(headers: list[str]) -> dict[str, str]:
+    # build_field_map() as it was: candidate names normalised again on every call
+    by_norm = {_norm_uncached(h): h for h in headers}
+    mapping: dict[str, str] = {}
+    for key, names in converter.FIELD_CANDIDATES.items():
+        for n in names:
+            nn = _norm_uncached(n)
+            if nn in by_norm:
+                mapping[key] = by_norm[nn]
+                break
+    return mapping
+
+
+def _random_headers(rnd: random.Random) -> list[str]:
+    aliases = [n for names in converter.FIELD_CANDIDATES.values() for n in names]
+    headers = rnd.sample(aliases, rnd.randint(1, 12)) + rnd.sample(["Created", "Id", "Notes "], 1)
+    return [rnd.choice([h, h.upper(), h.replace(" ", "_"), f" {h} "]) for h in headers]
+
+
+def check_field_map_equivalence(samples: int = 20_000, seed: int = 0) -> None:
+    """Property check: the alias-index build_field_map() matches the original algorithm."""
+    rnd = random.Random(seed)
+    for _ in range(samples):
+        headers = _random_headers(rnd)
+        expected = _build_field_map_reference(headers)
+        got = converter.build_field_map(headers)
+        assert got == expected, f"{headers!r}: got {got!r}, expected {expected!r}"
+
+
+# Headers fuzzy matching must not map to any field: a known alias plus an extra word.
+FUZZY_REJECTS = ["Category Id", "Folder ID", "CategoryId", "Starred At", "Group Name", "Notes URL"]
+
+# Near-miss headers fuzzy matching must map, with the field expected.
+FUZZY_ACCEPTS = {
+    "E-mail adress": "username",
+    "Pasword": "password",
+    "Mot de pase": "password",
+    "Nom d\u2019utilisateur": "username",
+    "OneTimePasword": "totp",
+}
+
+
+def check_fuzzy_matches() -> None:
+    """Fixed cases for match_fields(): FUZZY_REJECTS stay unmatched, FUZZY_ACCEPTS match."""
+    for header in FUZZY_REJECTS:
+        got = converter.match_fields(["Title", header])
+        assert [m.field for m in got] == ["title"], f"{header!r} matched {got[1:]!r}"
+    for header, field in FUZZY_ACCEPTS.items():
+        got = {m.field: m.header for m in converter.match_fields(["Title", header])}
+        assert got.get(field) == header, f"{header!r}: expected {field}, got {got!r}"
+
+
+def check_delta_commit(in_path: str) -> None:
+    """
+    A --delta run whose writer fails after consuming every row must leave the
+    fingerprint index as it was; a successful run then records every row.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        _check_delta_commit(in_path, os.path.join(work_dir, "delta.csv"))
+
+
+def _check_delta_commit(in_path: str, out_path: str) -> None:
+    index_path = converter.delta_index_path(out_path)
+
+    def failing_writer(bw_rows, out_path, buffer_size=-1):
+        for _ in bw_rows:
+            pass
+        raise OSError("simulated write failure")
+
+    converter.WRITERS["failing"] = failing_writer
+    try:
+        converter.convert(
+            in_path, out_path, stages=[converter.DeltaFilter(index_path)], out_format="failing"
+        )
+    except OSError:
+        pass
+    finally:
+        del converter.WRITERS["failing"]
+    assert not os.path.exists(index_path), "failed run wrote the fingerprint index"
+
+    written = converter.convert(in_path, out_path, stages=[converter.DeltaFilter(index_path)])
+    assert written > 0 and os.path.getsize(index_path) == 16 * written, "index incomplete"
+    again = converter.convert(in_path, out_path, stages=[converter.DeltaFilter(index_path)])
+    assert again == 0, f"second --delta run wrote {again} rows"
+
+
+# HKDF-Expand, RFC 5869 test case 1 (SHA-256): PRK, info, first 32 bytes of OKM.
+HKDF_VECTOR = (
+    "077709362c2e32df0ddc3f0dc47bba6390b6c73bb50f9c3122ec844ad7c2b3e5",
+    "f0f1f2f3f4f5f6f7f8f9",
+    "3cb25f25faacd57a90434f64d0362f2a2d2d0a90cf1a5a4c5db02d56ecc4c5bf",
+)
+
+# A password-protected export key and EncString computed independently with the
+# OpenSSL CLI (`openssl kdf ... PBKDF2`, `openssl kdf ... HKDF` in EXPAND_ONLY mode
+# with info "enc"/"mac", `openssl enc -aes-256-cbc`, `openssl dgst -mac HMAC`).
+EXPORT_VECTOR = {
+    "password": "correct-horse",
+    "salt": "c2FsdHNhbHRzYWx0c2FsdA==",
+    "iterations": 5000,
+    "enc_key": "e0180c3f6cf08142b117c289002f78352ac4fc4f4eda1e54a7a39ab5325944eb",
+    "mac_key": "2c7cc5f2c78201b6b2c4045924f7f15238fe0c750a166b9fcb30fc3e25b7c8c1",
+    "iv": "000102030405060708090a0b0c0d0e0f",
+    "plaintext": '{"encrypted":false,"items":[]}',
+    "enc_string": "2.AAECAwQFBgcICQoLDA0ODw==|5qsSQ1sMi8l1EeHh3WZ/IfUJRP4mJNiyWGfjg9QEmNI="
+    "|QeTCmnnn6m+WlVYx9KKr4scC5wvMNNYa9GMUrjmG0vs=",
+}
+
+
+def check_export_crypto() -> bool:
+    """
+    Fixed-vector check of the encrypted export: HKDF-Expand against RFC 5869, and
+    derive_export_keys() plus the EncString writer against EXPORT_VECTOR. Returns
+    False if the EncString part was skipped (cryptography not installed).
+    """
+    prk, info, okm = (bytes.fromhex(h) for h in HKDF_VECTOR)
+    assert converter._hkdf_expand(prk, info) == okm, "HKDF-Expand differs from RFC 5869"
+
+    v = EXPORT_VECTOR
+    enc_key, mac_key = converter.derive_export_keys(v["password"], v["salt"], v["iterations"])
+    assert enc_key.hex() == v["enc_key"], f"enc key {enc_key.hex()} != {v['enc_key']}"
+    assert mac_key.hex() == v["mac_key"], f"mac key {mac_key.hex()} != {v['mac_key']}"
+
+    try:
+        converter._load_aes()
+    except ImportError:
+        return False
+    out: list[str] = []
+    writer = converter._EncStringWriter(out.append, enc_key, mac_key, bytes.fromhex(v["iv"]))
+    writer.write(v["plaintext"])
+    writer.close()
+    assert "".join(out) == v["enc_string"], f"EncString {''.join(out)!r} != {v['enc_string']!r}"
+    return True
+
+
+def bench_field_map(files: int = 5_000, versions: int = 10) -> dict[str, float]:
+    """
+    Microseconds per file to resolve the header of `files` exports spread over
+    `versions` distinct header rows (the batch-conversion case).
+    """
+    rnd = random.Random(0)
+    distinct = [header_variant(v) for v in range(5)] + [
+        _random_headers(rnd) for _ in range(max(versions - 5, 0))
+    ]
+    headers = [(list(rnd.choice(distinct)),) for _ in range(files)]
+
+    def us(fn: Callable) -> float:
+        return min(time_calls(fn, headers) for _ in range(3)) / files * 1e6
+
+    return {
+        "original": us(_build_field_map_reference),
+        "alias index": us(converter.build_field_map),
+        "alias index + signature cache": us(converter.cached_field_map),
+    }
+
+
+def bench_helpers_micro(in_path: str, limit: int = 100_000) -> dict[str, tuple[float, float]]:
+    """
+    Per-row microseconds (before, after) for the per-row helper calls of the convert()
+    loop: uncompiled/uncached reference versions vs the current ones.
+    """
+    records = list(converter.iter_apple_rows(in_path))
+    headers, data = records[0], records[1 : limit + 1]
+    field_map = converter.build_field_map(headers)
+    indices = dict(zip(converter.APPLE_FIELDS, converter.resolve_field_indices(headers, field_map)))
+    ti, fi = indices["title"], indices["favorite"]
+    titles = [(r[ti] if ti >= 0 else "",) for r in data]
+    favorites = [(r[fi] if fi >= 0 else "",) for r in data]
+    n = max(len(data), 1)
+
+    def us(fn: Callable, args_list: list[tuple]) -> float:
+        return min(time_calls(fn, args_list) for _ in range(3)) / n * 1e6
+
+    return {
+        "to_bool_favorite": (
+            us(_to_bool_favorite_uncached, favorites),
+            us(converter.to_bool_favorite, favorites),
+        ),
+        "looks_like_url_or_domain": (
+            us(_looks_like_url_or_domain_uncached, titles),
+            us(converter.looks_like_url_or_domain, titles),
+        ),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the Apple -> Bitwarden converter.")
+    ap.add_argument("--rows", type=int, default=100_000, help="Synthetic rows (default: 100000)")
+    ap.add_argument(
+        "--variant",
+        type=int,
+        default=0,
+        help="Header variant: index into each FIELD_CANDIDATES list (default: 0)",
+    )
+    ap.add_argument(
+        "--urlless-ratio",
+        type=float,
+        default=0.2,
+        help="Fraction of rows with a title but no URL (default: 0.2)",
+    )
+    ap.add_argument(
+        "--multiline-ratio",
+        type=float,
+        default=0.1,
+        help="Fraction of rows with multi-line notes (default: 0.1)",
+    )
+    ap.add_argument("--no-bom", action="store_true", help="Write the input without a UTF-8 BOM")
+    ap.add_argument("--repeat", type=int, default=3, help="convert() repetitions, best is kept")
+    ap.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    ap.add_argument(
+        "--dup-ratio",
+        type=float,
+        default=0.0,
+        help="Fraction of rows repeating an earlier login (default: 0)",
+    )
+    ap.add_argument(
+        "--dedupe-memory",
+        metavar="SIZE",
+        help="Also compare time and peak RSS of --dedupe with the in-memory index and "
+        "with a disk index capped at SIZE (e.g. 16M)",
+    )
+    ap.add_argument(
+        "--check",
+        action="store_true",
+        help="Also run the randomised equivalence checks (fast hostname vs urlparse, "
+        "build_field_map vs the original algorithm) and the encrypted-export test vectors",
+    )
+    ap.add_argument(
+        "--write-dir",
+        help="Time the writer against a file in this directory (e.g. a network mount) "
+        "instead of os.devnull",
+    )
+    ap.add_argument("--keep", metavar="PATH", help="Write the synthetic input to PATH and keep it")
+    args = ap.parse_args()
+
+    tmp_dir = None
+    if args.keep:
+        in_path = args.keep
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        in_path = os.path.join(tmp_dir.name, "apple.csv")
+
+    try:
+        generate_apple_csv(
+            in_path,
+            rows=args.rows,
+            variant=args.variant,
+            urlless_ratio=args.urlless_ratio,
+            bom=not args.no_bom,
+            multiline_ratio=args.multiline_ratio,
+            seed=args.seed,
+            dup_ratio=args.dup_ratio,
+        )
+        size_mb = os.path.getsize(in_path) / (1024 * 1024)
+        print(f"input: {args.rows} rows, {size_mb:.1f} MiB, header={header_variant(args.variant)}")
+
+        if args.dedupe_memory:
+            # Run first: a child's peak RSS includes what it shared with this process at fork
+            print("dedupe (fresh process each):")
+            for name, (secs, rss) in bench_dedupe(in_path, args.dedupe_memory).items():
+                rss_text = f"{rss:.1f} MiB" if rss is not None else "n/a"
+                print(f"  {name:<26} {secs:8.3f}s  peak RSS {rss_text}")
+
+        secs = bench_convert(in_path, repeat=args.repeat)
+        rss = peak_rss_mb()
+        print(f"convert: {secs:.3f}s  {args.rows / secs:,.0f} rows/sec")
+        print(f"peak RSS: {rss:.1f} MiB" if rss is not None else "peak RSS: n/a")
+
+        print("stages:")
+        write_path = os.path.join(args.write_dir, "bench-out.csv") if args.write_dir else os.devnull
+        try:
+            stage_times = bench_stages(in_path, write_path)
+        finally:
+            if write_path != os.devnull and os.path.exists(write_path):
+                os.remove(write_path)
+        for name, stage_secs in stage_times.items():
+            per_row = stage_secs / max(args.rows, 1) * 1e6
+            print(f"  {name:<26} {stage_secs:8.3f}s  {per_row:6.2f} us/row")
+
+        print("helpers (uncompiled -> compiled/cached):")
+        saved = 0.0
+        for name, (before, after) in bench_helpers_micro(in_path).items():
+            saved += before - after
+            print(f"  {name:<26} {before:6.2f} -> {after:6.2f} us/call")
+        print(f"  per-row saving in convert(): {saved:.2f} us")
+
+        print("header mapping per file (batch case):")
+        for name, us_per_file in bench_field_map().items():
+            print(f"  {name:<30} {us_per_file:7.2f} us")
+
+        before, after = bench_hostname(in_path)
+        print(f"hostname (uncached): urlparse {before:.2f} us -> fast path {after:.2f} us per URL")
+
+        if args.check:
+            hits = check_hostname_equivalence(seed=args.seed)
+            print(f"hostname property check: ok ({hits} fast-path hits)")
+            check_field_map_equivalence(seed=args.seed)
+            print("build_field_map property check: ok")
+            check_fuzzy_matches()
+            print("fuzzy header match cases: ok")
+            check_delta_commit(in_path)
+            print("delta index commit check: ok")
+            full = check_export_crypto()
+            print(
+                "export crypto vectors: ok"
+                + ("" if full else " (keys only; EncString skipped, cryptography not installed)")
+            )
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
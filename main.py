@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Convert Apple Passwords / iCloud Passwords CSV export to Bitwarden CSV import.
+Convert Apple Passwords / iCloud Passwords CSV export to Bitwarden CSV (or JSON) import.
 
 Bitwarden CSV columns (required order):
 folder,favorite,type,name,notes,fields,login_uri,login_username,login_password,login_totp
@@ -11,9 +11,44 @@ This script auto-detects common Apple/Safari/iCloud column names.
 from __future__ import annotations
 
 import argparse
+import asyncio
+import base64
+import cProfile
 import csv
+import difflib
+import getpass
+import glob
+import hashlib
+import hmac
+import http.client
+import io
+import json
+import math
+import mmap
 import os
+import pstats
+import queue
 import re
+import shutil
+import sqlite3
+import tempfile
+import unicodedata
+import uuid
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from functools import lru_cache, partial
+from itertools import chain, islice
+from operator import itemgetter
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Sequence,
+)
 from urllib.parse import urlparse
 
 BW_HEADER = [
@@ -29,9 +64,79 @@ BW_HEADER = [
     "login_totp",
 ]
 
+# Target size in bytes of the input chunks mapped in parallel by iter_chunked_rows().
+CHUNK_SIZE = 4 * 1024 * 1024
 
+# Default number of distinct URLs whose hostname guess_name() keeps cached.
+HOSTNAME_CACHE_SIZE = 4096
+
+# Default PBKDF2 iterations for encrypted exports (Bitwarden's own default).
+KDF_ITERATIONS = 600_000
+
+# Minimum score for a fuzzy header match (see match_fields()).
+FUZZY_THRESHOLD = 0.8
+
+# Input bytes aconvert() collects before handing them to the executor as one block.
+ASYNC_BLOCK_SIZE = 1024 * 1024
+
+# Input bytes converted between two checkpoints by convert(checkpoint=True).
+CHECKPOINT_BYTES = 16 * 1024 * 1024
+
+# Rows sampled (from the start of the input) to infer unmatched columns from their values.
+INFER_SAMPLE_ROWS = 200
+
+# Minimum score for a column inferred from its values (see infer_fields()).
+INFER_THRESHOLD = 0.6
+
+# Rows formatted per writerows() call by write_bitwarden().
+WRITE_BATCH = 1024
+
+# Default address of the Bitwarden CLI's local REST API (bw serve).
+BW_SERVE_URL = "http://localhost:8087"
+
+# Items sent per round of concurrent requests by write_bw_serve().
+BW_SERVE_BATCH = 256
+
+# Position of each Bitwarden column in a BwRow tuple.
+BW_INDEX = {k: i for i, k in enumerate(BW_HEADER)}
+
+_NAME = BW_INDEX["name"]
+_URI = BW_INDEX["login_uri"]
+_USERNAME = BW_INDEX["login_username"]
+_PASSWORD = BW_INDEX["login_password"]
+
+# Item details Deduper carries over from a removed duplicate, and which keep apart
+# logins that disagree on them.
+_DETAILS = (BW_INDEX["folder"], BW_INDEX["notes"], BW_INDEX["login_totp"])
+
+# Apple fields resolved by build_field_map(), in the order map_to_bitwarden() reads them.
+APPLE_FIELDS = ("title", "url", "username", "password", "notes", "totp", "folder", "favorite")
+
+# A Bitwarden row: one value per BW_HEADER column, in the same order.
+BwRow = tuple[str, ...]
+
+# A pipeline stage: takes a stream of Bitwarden rows and yields a (possibly modified) stream.
+Stage = Callable[[Iterable[BwRow]], Iterable[BwRow]]
+
+
+_NORM_SEP_RE = re.compile(r"[\s_\-]+")
+_URL_SCHEME_RE = re.compile(r"^(https?://)", re.I)
+_DOMAIN_RE = re.compile(r"^[a-z0-9.-]+\.[a-z]{2,}(/.*)?$", re.I)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[a-z]{2,}$", re.I)
+_SIMPLE_URL_RE = re.compile(
+    r"([A-Za-z][A-Za-z0-9+.\-]*://)?([A-Za-z0-9._\-]+)(?::[0-9]*)?(?=[/?#]|\Z)"
+)
+
+# Favorite values treated as "on" (compared after norm()).
+TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
+
+
+# Headers and favorite values repeat endlessly, so normalised forms are cached.
+@lru_cache(maxsize=4096)
 def norm(s: str) -> str:
-    return re.sub(r"[\s_\-]+", "", (s or "").strip().lower())
+    return _NORM_SEP_RE.sub("", (s or "").strip().lower())
 
 
 def safe_strip(v) -> str:
@@ -58,6 +163,25 @@ def guess_name(title: str, url: str) -> str:
     if not u:
         return ""
 
+    return _hostname(u)
+
+
+def _fast_hostname(u: str) -> str | None:
+    """
+    Hostname of a plain "scheme://host[:port]/..." or "host[:port]/..." string, matching
+    what urlparse() gives; None when u has any other shape.
+    """
+    m = _SIMPLE_URL_RE.match(u)
+    # A "://" further in (e.g. in a query string) means urlparse sees no host at all.
+    if m is None or (m.group(1) is None and "://" in u):
+        return None
+    return m.group(2).lower()
+
+
+def _parse_hostname(u: str) -> str:
+    host = _fast_hostname(u)
+    if host is not None:
+        return host
     try:
         p = urlparse(u if "://" in u else "https://" + u)
         host = safe_strip(p.hostname)
@@ -66,125 +190,2291 @@ def guess_name(title: str, url: str) -> str:
         return u
 
 
+# Exports repeat the same few domains many times, so URL -> hostname is memoised.
+_hostname = lru_cache(maxsize=HOSTNAME_CACHE_SIZE)(_parse_hostname)
+
+
+def set_hostname_cache_size(maxsize: int | None) -> None:
+    """Resize (and clear) the URL -> hostname cache. 0 disables it, None makes it unbounded."""
+    global _hostname
+    _hostname = lru_cache(maxsize=maxsize)(_parse_hostname)
+
+
+def format_cache_stats() -> str:
+    """Hit/miss report for the helper caches of this process."""
+    lines = []
+    for name, info in (("hostname", _hostname.cache_info()), ("norm", norm.cache_info())):
+        calls = info.hits + info.misses
+        rate = 100.0 * info.hits / calls if calls else 0.0
+        size = f"{info.currsize}/{info.maxsize}" if info.maxsize is not None else f"{info.currsize}"
+        lines.append(
+            f"{name} cache: {info.hits} hits, {info.misses} misses "
+            f"({rate:.1f}% hit rate), size {size}"
+        )
+    return "\n".join(lines)
+
+
+# Header names recognised for each Apple field, in priority order.
+FIELD_CANDIDATES: dict[str, list[str]] = {
+    "title": ["title", "name", "website name", "site", "service"],
+    "url": ["url", "website", "website url", "websiteurl", "uri", "link"],
+    "username": ["username", "user name", "login", "account", "email"],
+    "password": ["password", "pass", "passwd"],
+    "notes": ["notes", "note", "comments", "comment"],
+    "totp": [
+        "otp",
+        "totp",
+        "one-time password",
+        "onetimepassword",
+        "verification code",
+        "verificationcode",
+        "2fa",
+        "two-factor",
+        "twofactor",
+        "authenticator",
+    ],
+    "folder": ["folder", "group", "category", "collection"],
+    "favorite": ["favorite", "favourite", "star", "starred"],
+}
+
+
+# Header names from localised Safari/Passwords versions and third-party exporters.
+# They rank after the FIELD_CANDIDATES names of the same field.
+EXTRA_CANDIDATES: dict[str, list[str]] = {
+    "title": ["titre", "titel", "título", "titolo", "nom", "nombre", "naam", "item name"],
+    "url": [
+        "login url",
+        "login uri",
+        "site web",
+        "adresse web",
+        "webseite",
+        "webadresse",
+        "sitio web",
+        "sito web",
+        "endereço",
+        "adres",
+    ],
+    "username": [
+        "e-mail address",
+        "email address",
+        "login name",
+        "nom d'utilisateur",
+        "identifiant",
+        "benutzername",
+        "benutzer",
+        "nombre de usuario",
+        "usuario",
+        "nome utente",
+        "nome de usuário",
+        "gebruikersnaam",
+    ],
+    "password": ["mot de passe", "passwort", "kennwort", "contraseña", "senha", "wachtwoord"],
+    "notes": ["notizen", "notas", "notities", "remarques", "extra"],
+    "totp": ["otpauth", "otp auth", "code de vérification", "bestätigungscode", "mfa"],
+    "folder": ["dossier", "ordner", "carpeta", "cartella", "pasta", "map", "grouping"],
+    "favorite": ["favori", "favoris", "favorit", "favorito", "favoriet"],
+}
+
+
+def _field_aliases() -> Iterator[tuple[str, int, str]]:
+    for table in (FIELD_CANDIDATES, EXTRA_CANDIDATES):
+        offset = table is EXTRA_CANDIDATES
+        for key, names in table.items():
+            base = len(FIELD_CANDIDATES[key]) if offset else 0
+            for priority, name in enumerate(names):
+                yield key, base + priority, name
+
+
+def _build_alias_index() -> dict[str, list[tuple[str, int]]]:
+    index: dict[str, list[tuple[str, int]]] = {}
+    for key, priority, name in _field_aliases():
+        hits = index.setdefault(norm(name), [])
+        # Aliases normalising alike within one field keep the best priority
+        if not any(k == key for k, _ in hits):
+            hits.append((key, priority))
+    return index
+
+
+# Normalised alias -> [(field, priority)], built once from the candidate tables.
+ALIAS_INDEX = _build_alias_index()
+
+
+def _fold(s: str) -> str:
+    """Lowercase s and drop accents and curly quotes, for fuzzy comparison."""
+    s = unicodedata.normalize("NFKD", s.replace("\u2019", "'").lower())
+    return "".join(c for c in s if not unicodedata.combining(c))
+
+
+# (field, folded alias without separators, alias word tokens) for fuzzy matching.
+_FUZZY_ALIASES = [
+    (key, _NORM_SEP_RE.sub("", _fold(name)), frozenset(_WORD_RE.findall(_fold(name))))
+    for key, _, name in _field_aliases()
+]
+
+
 def build_field_map(headers: list[str]) -> dict[str, str]:
-    candidates: dict[str, list[str]] = {
-        "title": ["title", "name", "website name", "site", "service"],
-        "url": ["url", "website", "website url", "websiteurl", "uri", "link"],
-        "username": ["username", "user name", "login", "account", "email"],
-        "password": ["password", "pass", "passwd"],
-        "notes": ["notes", "note", "comments", "comment"],
-        "totp": [
-            "otp",
-            "totp",
-            "one-time password",
-            "onetimepassword",
-            "verification code",
-            "verificationcode",
-            "2fa",
-            "two-factor",
-            "twofactor",
-            "authenticator",
-        ],
-        "folder": ["folder", "group", "category", "collection"],
-        "favorite": ["favorite", "favourite", "star", "starred"],
+    """
+    Map Apple fields to header names in one pass over the headers: for each field
+    the header matching its highest-priority alias wins (the last one, if several
+    headers normalise alike).
+    """
+    best: dict[str, tuple[int, str]] = {}
+    for h in headers:
+        for key, priority in ALIAS_INDEX.get(norm(h), ()):
+            current = best.get(key)
+            if current is None or priority <= current[0]:
+                best[key] = (priority, h)
+
+    return {key: best[key][1] for key in FIELD_CANDIDATES if key in best}
+
+
+class FieldMatch(NamedTuple):
+    field: str
+    header: str
+    alias: str  # normalised alias the header matched
+    score: float  # confidence, 1.0 for exact matches
+    exact: bool
+
+
+def _similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _fuzzy_score(header: str, alias: str, alias_tokens: frozenset[str]) -> float:
+    """
+    Similarity of header to an alias. A one-word header ("Pasword", "CategoryId" is
+    two) is compared by edit similarity to the alias without separators. Longer
+    headers are compared word by word: every word on either side counts by its best
+    edit similarity to a word on the other side, so a known alias plus an extra word
+    ("Category Id", "Starred At") scores low.
+    """
+    tokens = _WORD_RE.findall(_fold(_CAMEL_RE.sub(" ", header)))
+    if not tokens:
+        return 0.0
+    if len(tokens) == 1:
+        return _similarity(tokens[0], alias)
+    total = sum(max(_similarity(t, a) for a in alias_tokens) for t in tokens) + sum(
+        max(_similarity(a, t) for t in tokens) for a in alias_tokens
+    )
+    return total / (len(tokens) + len(alias_tokens))
+
+
+def match_fields(headers: list[str], threshold: float = FUZZY_THRESHOLD) -> list[FieldMatch]:
+    """
+    Match Apple fields to headers, with a confidence score per match.
+
+    Exact matches come from build_field_map(). Fields left over are scored against
+    every remaining header over the whole alias table (localised names included),
+    and assigned best score first while the score is at least threshold; each
+    header is used once.
+    """
+    exact = build_field_map(headers)
+    matches = [FieldMatch(key, h, norm(h), 1.0, True) for key, h in exact.items()]
+    used = set(exact.values())
+
+    scored: list[tuple[float, str, str, str]] = []
+    for h in headers:
+        if h in used or not h.strip():
+            continue
+        for key, alias, tokens in _FUZZY_ALIASES:
+            if key in exact:
+                continue
+            score = _fuzzy_score(h, alias, tokens)
+            if score >= threshold:
+                scored.append((score, key, h, alias))
+
+    taken = set(exact)
+    for score, key, h, alias in sorted(scored, key=lambda s: -s[0]):
+        if key not in taken and h not in used:
+            matches.append(FieldMatch(key, h, alias, round(score, 3), False))
+            taken.add(key)
+            used.add(h)
+
+    order = {key: i for i, key in enumerate(APPLE_FIELDS)}
+    return sorted(matches, key=lambda m: order[m.field])
+
+
+def resolve_field_map(headers: list[str]) -> dict[str, str]:
+    """Field map from match_fields(): exact matches, then confident fuzzy ones."""
+    return {m.field: m.header for m in match_fields(headers)}
+
+
+# Fields whose column infer_fields() can recognise from the values alone.
+INFERABLE_FIELDS = ("url", "username", "password", "totp")
+
+
+def _char_entropy(s: str) -> float:
+    """Shannon entropy of s in bits per character."""
+    n = len(s)
+    return -sum(c / n * math.log2(c / n) for c in Counter(s).values())
+
+
+def _looks_like_password(v: str) -> bool:
+    return (
+        6 <= len(v) <= 128
+        and not any(c.isspace() for c in v)
+        and not _EMAIL_RE.match(v)
+        and "://" not in v
+        and not looks_like_url_or_domain(v)
+        and _char_entropy(v) >= 2.5
+    )
+
+
+def score_column(values: Sequence[str]) -> dict[str, float]:
+    """
+    Score how much a column's values look like each of INFERABLE_FIELDS, from 0 to 1.
+
+    Each score is the share of non-empty values passing a cheap check: an otpauth://
+    URI for totp, an email address for username, a URL or bare domain for url. The
+    password score is the share of space-free, high-entropy values, scaled down for
+    repeated values and for low average entropy (usernames, codes).
+    """
+    vals = [v for v in map(safe_strip, values) if v]
+    if not vals:
+        return dict.fromkeys(INFERABLE_FIELDS, 0.0)
+    n = len(vals)
+    totp = sum(v[:10].lower() == "otpauth://" for v in vals)
+    email = sum(bool(_EMAIL_RE.match(v)) for v in vals)
+    url = sum(looks_like_url_or_domain(v) for v in vals)
+    secret = [v for v in vals if _looks_like_password(v)]
+    password = 0.0
+    if secret:
+        strength = min(1.0, sum(map(_char_entropy, secret)) / len(secret) / 4.0)
+        password = len(secret) / n * len(set(vals)) / n * strength
+    return {"url": url / n, "username": email / n, "password": password, "totp": totp / n}
+
+
+def infer_fields(
+    headers: list[str],
+    sample: Iterable[Sequence[str]],
+    field_map: dict[str, str] | None = None,
+    threshold: float = INFER_THRESHOLD,
+) -> list[FieldMatch]:
+    """
+    Infer the INFERABLE_FIELDS missing from field_map from sampled rows.
+
+    Only columns field_map doesn't use are scored, and only the first
+    INFER_SAMPLE_ROWS rows of sample are read. Fields are assigned best score first
+    while the score is at least threshold; each column is used once. Inferred
+    matches have an empty alias.
+    """
+    field_map = field_map or {}
+    wanted = [key for key in INFERABLE_FIELDS if key not in field_map]
+    used = set(field_map.values())
+    free = [i for i, h in enumerate(headers) if h not in used and h.strip()]
+    if not wanted or not free:
+        return []
+
+    columns: dict[int, list[str]] = {i: [] for i in free}
+    for row in islice(sample, INFER_SAMPLE_ROWS):
+        for i in free:
+            if i < len(row):
+                columns[i].append(row[i])
+
+    scored = [
+        (score, key, headers[i])
+        for i in free
+        for key, score in score_column(columns[i]).items()
+        if key in wanted and score >= threshold
+    ]
+    matches = []
+    done: set[str] = set()
+    for score, key, h in sorted(scored, key=lambda s: -s[0]):
+        if key not in done and h not in used:
+            matches.append(FieldMatch(key, h, "", round(score, 3), False))
+            done.add(key)
+            used.add(h)
+    return matches
+
+
+def complete_field_map(
+    headers: list[str], sample: Iterable[Sequence[str]], field_map: dict[str, str]
+) -> dict[str, str]:
+    """field_map plus the fields infer_fields() recognises from sample; field_map is not changed."""
+    if all(key in field_map for key in INFERABLE_FIELDS):
+        return field_map
+    inferred = infer_fields(headers, sample, field_map)
+    return {**field_map, **{m.field: m.header for m in inferred}} if inferred else field_map
+
+
+def format_field_matches(matches: Sequence[FieldMatch]) -> str:
+    lines = []
+    for m in matches:
+        if m.exact:
+            how = "exact"
+        elif m.alias:
+            how = f"fuzzy {m.score:.2f} ~ {m.alias!r}"
+        else:
+            how = f"inferred from values {m.score:.2f}"
+        lines.append(f"  {m.field:<9} <- {m.header!r} ({how})")
+    missing = [key for key in APPLE_FIELDS if key not in {m.field for m in matches}]
+    if missing:
+        lines.append(f"  unmatched: {', '.join(missing)}")
+    return "\n".join(lines)
+
+
+# Resolved field maps by header_signature(); exports of one Apple version share a header.
+_field_map_cache: dict[str, dict[str, str]] = {}
+
+
+def header_signature(headers: Sequence[str]) -> str:
+    """Short stable hash of a header row."""
+    return hashlib.sha256("\x1f".join(headers).encode("utf-8")).hexdigest()[:32]
+
+
+def cached_field_map(headers: list[str]) -> dict[str, str]:
+    """resolve_field_map(), memoised per distinct header row."""
+    sig = header_signature(headers)
+    field_map = _field_map_cache.get(sig)
+    if field_map is None:
+        field_map = _field_map_cache[sig] = resolve_field_map(headers)
+    return field_map
+
+
+# Bump when the header matching changes in a way the alias tables don't show.
+MAPPING_CACHE_VERSION = 1
+
+
+def mapping_cache_matcher() -> str:
+    """
+    Hash of everything a cached field map depends on: MAPPING_CACHE_VERSION, the
+    alias tables and FUZZY_THRESHOLD. A cache file written under another matcher
+    is stale.
+    """
+    spec = [MAPPING_CACHE_VERSION, FIELD_CANDIDATES, EXTRA_CANDIDATES, FUZZY_THRESHOLD]
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _read_mapping_cache(path: str) -> tuple[dict[str, dict[str, str]], str]:
+    """
+    The valid, current field maps stored in path, and a description of what was
+    ignored ("" if nothing). A missing file is an empty cache.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except FileNotFoundError:
+        return {}, ""
+    except (OSError, ValueError) as e:
+        return {}, f"unreadable ({e})"
+    if not isinstance(doc, dict) or not isinstance(doc.get("mappings"), dict):
+        return {}, "not a mapping cache"
+    if doc.get("matcher") != mapping_cache_matcher():
+        return {}, "written by a different version of the header matching"
+    mappings = {
+        sig: field_map
+        for sig, field_map in doc["mappings"].items()
+        if isinstance(field_map, dict)
+        and all(k in APPLE_FIELDS and isinstance(v, str) for k, v in field_map.items())
     }
+    skipped = len(doc["mappings"]) - len(mappings)
+    return mappings, f"{skipped} malformed entr{'y' if skipped == 1 else 'ies'}" if skipped else ""
 
-    by_norm = {norm(h): h for h in headers}
 
-    mapping: dict[str, str] = {}
-    for key, names in candidates.items():
-        for n in names:
-            nn = norm(n)
-            if nn in by_norm:
-                mapping[key] = by_norm[nn]
-                break
+def load_mapping_cache(path: str) -> None:
+    """
+    Add the field maps persisted in path (if it exists) to the in-memory cache.
+    A corrupt or stale file is reported and ignored; headers are then detected again.
+    """
+    mappings, problem = _read_mapping_cache(path)
+    if problem:
+        print(f"Ignoring mapping cache {path}: {problem}")
+    _field_map_cache.update(mappings)
+
+
+def save_mapping_cache(path: str) -> None:
+    """Persist the in-memory field maps to path, keeping the current entries already in it."""
+    stored, _ = _read_mapping_cache(path)
+    stored.update(_field_map_cache)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"matcher": mapping_cache_matcher(), "mappings": stored}, f, indent=2, sort_keys=True
+        )
+    os.replace(tmp_path, path)
+
 
-    return mapping
+def load_mapping_file(path: str) -> dict[str, str]:
+    """Read an explicit field map ({"title": "<column>", "url": ...}) from a JSON file."""
+    with open(path, "r", encoding="utf-8") as f:
+        field_map = json.load(f)
+    if not isinstance(field_map, dict) or not all(
+        isinstance(v, str) for v in field_map.values()
+    ):
+        raise ValueError(f"{path}: expected a JSON object of field name -> column name.")
+    unknown = sorted(set(field_map) - set(APPLE_FIELDS))
+    if unknown:
+        raise ValueError(
+            f"{path}: unknown field(s) {', '.join(unknown)}; known: {', '.join(APPLE_FIELDS)}"
+        )
+    return field_map
+
+
+def save_mapping_file(path: str, field_map: dict[str, str]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(field_map, f, indent=2)
+        f.write("\n")
+
+
+def read_headers(in_path: str) -> list[str]:
+    """Header row of an Apple export."""
+    rows = iter_apple_rows(in_path)
+    try:
+        return next(rows)
+    finally:
+        rows.close()
+
+
+def read_sample(in_path: str, rows: int = INFER_SAMPLE_ROWS) -> tuple[list[str], list[list[str]]]:
+    """Header row and up to the first rows records of an Apple export."""
+    it = iter_apple_rows(in_path)
+    try:
+        return next(it), list(islice(it, rows))
+    finally:
+        it.close()
 
 
 def to_bool_favorite(val: str) -> str:
     v = norm(val)
-    return "1" if v in {"1", "true", "yes", "y", "on"} else ""
+    return "1" if v in TRUTHY else ""
 
 
 def looks_like_url_or_domain(s: str) -> bool:
     s = safe_strip(s)
     if not s:
         return False
-    return bool(
-        re.match(r"^(https?://)", s, re.I)
-        or re.match(r"^[a-z0-9.-]+\.[a-z]{2,}(/.*)?$", s, re.I)
-    )
+    return bool(_URL_SCHEME_RE.match(s) or _DOMAIN_RE.match(s))
 
 
-def convert(in_path: str, out_path: str) -> None:
+def iter_apple_rows(in_path: str) -> Iterator[list[str]]:
+    """Yield the header row of an Apple export, then every record, as lists of strings."""
     # Apple exports are often UTF-8 with BOM
     with open(in_path, "r", encoding="utf-8-sig", newline="") as f_in:
-        reader = csv.DictReader(f_in)
-        if not reader.fieldnames:
+        reader = csv.reader(f_in)
+        headers = next(reader, None)
+        if not headers:
             raise ValueError("Input CSV has no header row.")
+        yield headers
+        yield from reader
+
+
+def resolve_field_indices(headers: Sequence[str], field_map: dict[str, str]) -> tuple[int, ...]:
+    """
+    Resolve a build_field_map() result to column indices, in APPLE_FIELDS order.
+
+    Unmapped fields resolve to -1. When a header name repeats, the last column wins
+    (same as csv.DictReader). Raises ValueError if field_map names a column the
+    header doesn't have (e.g. a mapping file made for another export).
+    """
+    pos = {h: i for i, h in enumerate(headers)}
+    missing = [h for h in field_map.values() if h not in pos]
+    if missing:
+        raise ValueError(f"Mapped column(s) not in input header: {', '.join(map(repr, missing))}")
+    return tuple(pos.get(field_map.get(key, ""), -1) for key in APPLE_FIELDS)
+
+
+def map_to_bitwarden(
+    rows: Iterable[list[str]], field_map: dict[str, str] | None = None
+) -> Iterator[BwRow]:
+    """
+    Map Apple rows to Bitwarden rows (tuples in BW_HEADER order).
+
+    The first row must be the header. If field_map is not given it is resolved from
+    it with cached_field_map(), and fields still missing are inferred from the first
+    INFER_SAMPLE_ROWS rows (complete_field_map()). Completely empty rows are skipped.
+    """
+    it = iter(rows)
+    headers = next(it, None)
+    if headers is None:
+        return
+    if field_map is None:
+        field_map = cached_field_map(headers)
+        if not all(key in field_map for key in INFERABLE_FIELDS):
+            sample = list(islice(it, INFER_SAMPLE_ROWS))
+            field_map = complete_field_map(headers, sample, field_map)
+            it = chain(sample, it)
+
+    width = len(headers)
+    pick = itemgetter(*resolve_field_indices(headers, field_map))
+
+    for row in it:
+        # Pad short rows, then append "" so unmapped fields (index -1) read as empty.
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+        row.append("")
+
+        title, url, username, password, notes, totp, folder, favorite_raw = pick(row)
+        title = title.strip()
+        url = url.strip()
+        username = username.strip()
+        password = password.strip()
+        notes = notes.strip()
+
+        # If URL is empty but Title looks like a URL/domain, treat it as URL.
+        if not url and looks_like_url_or_domain(title):
+            url = title
+
+        name = guess_name(title, url)
+
+        # Skip completely empty rows
+        if name or url or username or password or notes:
+            yield (
+                folder.strip(),
+                to_bool_favorite(favorite_raw.strip()),
+                "login",
+                name,
+                notes,
+                "",
+                url,
+                username,
+                password,
+                totp.strip(),
+            )
+
+
+def write_bitwarden(bw_rows: Iterable[BwRow], out_path: str, buffer_size: int = -1) -> int:
+    """
+    Write Bitwarden rows to out_path as CSV. Returns the number of rows written.
+
+    Rows are formatted WRITE_BATCH at a time with writerows(); buffer_size sets the
+    output buffer in bytes (-1 for the io default), so large values turn many small
+    writes into few large ones.
+    """
+    count = 0
+    it = iter(bw_rows)
+    with open(out_path, "w", encoding="utf-8", newline="", buffering=buffer_size) as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(BW_HEADER)
+        while True:
+            batch = list(islice(it, WRITE_BATCH))
+            if not batch:
+                break
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def bitwarden_json_item(bw_row: BwRow, folder_ids: dict[str, str]) -> dict:
+    """
+    Bitwarden JSON import item for a Bitwarden row. New folder names are given an id
+    and added to folder_ids.
+    """
+    folder, favorite, _, name, notes, _, uri, username, password, totp = bw_row
+    folder_id = None
+    if folder:
+        folder_id = folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = folder_ids[folder] = str(uuid.uuid4())
+    return {
+        "organizationId": None,
+        "folderId": folder_id,
+        "type": 1,  # login
+        "reprompt": 0,
+        "name": name,
+        "notes": notes or None,
+        "favorite": favorite == "1",
+        "login": {
+            "uris": [{"match": None, "uri": u} for u in split_uris(uri)],
+            "username": username or None,
+            "password": password or None,
+            "totp": totp or None,
+        },
+        "collectionIds": None,
+    }
+
+
+def _write_json_document(bw_rows: Iterable[BwRow], write: Callable[[str], object]) -> int:
+    folder_ids: dict[str, str] = {}
+    count = 0
+    write('{\n  "encrypted": false,\n  "items": [')
+    for bw_row in bw_rows:
+        write(",\n    " if count else "\n    ")
+        write(json.dumps(bitwarden_json_item(bw_row, folder_ids), ensure_ascii=False))
+        count += 1
+    folders = [{"id": fid, "name": name} for name, fid in folder_ids.items()]
+    write('\n  ],\n  "folders": ')
+    write(json.dumps(folders, ensure_ascii=False))
+    write("\n}\n")
+    return count
+
+
+def write_bitwarden_json(bw_rows: Iterable[BwRow], out_path: str, buffer_size: int = -1) -> int:
+    """
+    Write Bitwarden rows in Bitwarden's (unencrypted) JSON import format.
+    Returns the number of items written.
+
+    Items are encoded and written one by one as rows arrive. Folder names are
+    collected on the way and the folder list is written after the items, so the
+    document is never built in memory.
+    """
+    with open(out_path, "w", encoding="utf-8", newline="\n", buffering=buffer_size) as f_out:
+        return _write_json_document(bw_rows, f_out.write)
+
+
+def _load_aes():
+    try:
+        from cryptography.hazmat.primitives import padding
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    except ImportError:
+        raise ImportError(
+            "Encrypted export needs the 'cryptography' package (pip install cryptography)."
+        ) from None
+    return padding, Cipher, algorithms, modes
+
+
+def _hkdf_expand(prk: bytes, info: bytes) -> bytes:
+    # HKDF-Expand (RFC 5869) with SHA-256; a single block covers the 32 bytes we need.
+    return hmac.new(prk, info + b"\x01", hashlib.sha256).digest()
+
+
+def derive_export_keys(password: str, salt: str, iterations: int) -> tuple[bytes, bytes]:
+    """
+    Keys of a Bitwarden password-protected export: PBKDF2-SHA256 of the password,
+    stretched with HKDF-Expand into (enc_key, mac_key).
+    """
+    key = hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt.encode("utf-8"), iterations, 32
+    )
+    return _hkdf_expand(key, b"enc"), _hkdf_expand(key, b"mac")
+
+
+class _EncStringWriter:
+    """
+    Streams text out as a Bitwarden type 2 EncString (AES-256-CBC, HMAC-SHA256):
+    "2.<iv>|<ciphertext>|<mac>", all base64. Ciphertext is base64-encoded in
+    multiples of 3 bytes as it is produced, and the MAC is updated along the way,
+    so the plaintext is never held in full. iv is random unless given (for fixed
+    test vectors).
+    """
+
+    def __init__(
+        self,
+        write: Callable[[str], object],
+        enc_key: bytes,
+        mac_key: bytes,
+        iv: bytes | None = None,
+    ) -> None:
+        padding, Cipher, algorithms, modes = _load_aes()
+        iv = iv or os.urandom(16)
+        self._write = write
+        self._padder = padding.PKCS7(128).padder()
+        self._encryptor = Cipher(algorithms.AES(enc_key), modes.CBC(iv)).encryptor()
+        self._mac = hmac.new(mac_key, iv, hashlib.sha256)
+        self._pending = b""
+        write("2." + base64.b64encode(iv).decode("ascii") + "|")
+
+    def write(self, s: str) -> None:
+        self._emit(self._encryptor.update(self._padder.update(s.encode("utf-8"))))
+
+    def _emit(self, ct: bytes) -> None:
+        self._mac.update(ct)
+        buf = self._pending + ct
+        cut = len(buf) - len(buf) % 3
+        self._write(base64.b64encode(buf[:cut]).decode("ascii"))
+        self._pending = buf[cut:]
+
+    def close(self) -> None:
+        self._emit(self._encryptor.update(self._padder.finalize()) + self._encryptor.finalize())
+        self._write(base64.b64encode(self._pending).decode("ascii"))
+        self._write("|" + base64.b64encode(self._mac.digest()).decode("ascii"))
+
+
+def write_bitwarden_encrypted_json(
+    bw_rows: Iterable[BwRow],
+    out_path: str,
+    buffer_size: int = -1,
+    password: str = "",
+    kdf_iterations: int = KDF_ITERATIONS,
+) -> int:
+    """
+    Write Bitwarden rows as a Bitwarden password-protected (encrypted) JSON export.
+    Returns the number of items written.
+
+    The key is derived once (PBKDF2-SHA256); the JSON document is then encrypted
+    and written as it is generated, the same way write_bitwarden_json() streams it.
+    """
+    if not password:
+        raise ValueError("Encrypted export needs a password.")
+    salt = base64.b64encode(os.urandom(16)).decode("ascii")
+    enc_key, mac_key = derive_export_keys(password, salt, kdf_iterations)
+
+    with open(out_path, "w", encoding="utf-8", newline="\n", buffering=buffer_size) as f_out:
+        validation: list[str] = []
+        check = _EncStringWriter(validation.append, enc_key, mac_key)
+        check.write(str(uuid.uuid4()))
+        check.close()
+
+        header = {
+            "encrypted": True,
+            "passwordProtected": True,
+            "salt": salt,
+            "kdfType": 0,  # PBKDF2-SHA256
+            "kdfIterations": kdf_iterations,
+            "kdfMemory": None,
+            "kdfParallelism": None,
+            "encKeyValidation_DO_NOT_EDIT": "".join(validation),
+        }
+        f_out.write(json.dumps(header, indent=2)[:-2] + ',\n  "data": "')
+        data = _EncStringWriter(f_out.write, enc_key, mac_key)
+        count = _write_json_document(bw_rows, data.write)
+        data.close()
+        f_out.write('"\n}\n')
+    return count
+
+
+def decrypt_bitwarden_export(path: str, password: str) -> dict:
+    """
+    Decrypt a password-protected export written by write_bitwarden_encrypted_json()
+    (or by Bitwarden) and return the inner JSON document. Raises ValueError on a
+    wrong password or a tampered file.
+    """
+    padding, Cipher, algorithms, modes = _load_aes()
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    enc_key, mac_key = derive_export_keys(password, doc["salt"], doc["kdfIterations"])
+
+    def decrypt(enc: str) -> bytes:
+        iv, ct, mac = (base64.b64decode(p) for p in enc.split(".", 1)[1].split("|"))
+        if not hmac.compare_digest(hmac.new(mac_key, iv + ct, hashlib.sha256).digest(), mac):
+            raise ValueError("Wrong password or corrupted export (MAC mismatch).")
+        decryptor = Cipher(algorithms.AES(enc_key), modes.CBC(iv)).decryptor()
+        unpadder = padding.PKCS7(128).unpadder()
+        return unpadder.update(decryptor.update(ct) + decryptor.finalize()) + unpadder.finalize()
+
+    decrypt(doc["encKeyValidation_DO_NOT_EDIT"])
+    return json.loads(decrypt(doc["data"]).decode("utf-8"))
+
+
+def iter_bitwarden_csv(path: str) -> Iterator[BwRow]:
+    """Read back a Bitwarden CSV written by write_bitwarden() as Bitwarden rows."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # header
+        for row in reader:
+            yield tuple(row)
+
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP connections to the server at base_url, each used by one thread
+    at a time; at most size connections are open.
+    """
+
+    def __init__(self, base_url: str, size: int, timeout: float = 60.0) -> None:
+        p = urlparse(base_url)
+        if p.scheme not in ("http", "https") or not p.hostname:
+            raise ValueError(f"Not an http(s) URL: {base_url!r}")
+        conn_class = (
+            http.client.HTTPSConnection if p.scheme == "https" else http.client.HTTPConnection
+        )
+        self._connect = partial(conn_class, p.hostname, p.port, timeout=timeout)
+        self._base = p.path.rstrip("/")
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)  # connected on first use
+
+    def request(self, method: str, path: str, body: dict | None = None) -> dict:
+        """Send a JSON request and return the decoded JSON response."""
+        payload = None if body is None else json.dumps(body).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        conn = self._idle.get()
+        try:
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect()
+            for retry in (False, True):
+                try:
+                    conn.request(method, self._base + path, body=payload, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # A kept-alive connection the server closed while idle is reopened
+                    # once. On a fresh one the server may have acted on the request
+                    # (e.g. created the item), so resending it could duplicate it.
+                    if retry or not reused:
+                        raise
+                    conn.close()
+                    conn = self._connect()
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            conn = None
+            raise
+        finally:
+            self._idle.put(conn)
+
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            result = {}
+        if resp.status >= 400 or result.get("success") is False:
+            message = result.get("message") or data[:200].decode("utf-8", "replace")
+            raise RuntimeError(f"bw serve: {method} {path} failed ({resp.status}): {message}")
+        return result
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            if conn is not None:
+                conn.close()
+
+
+def write_bw_serve(
+    bw_rows: Iterable[BwRow],
+    out_path: str = BW_SERVE_URL,
+    buffer_size: int = -1,
+    connections: int = 4,
+) -> int:
+    """
+    Create Bitwarden rows as items in a vault through the Bitwarden CLI's local
+    REST API (`bw serve`, which must be running and unlocked) at the URL out_path.
+    Returns the number of items created.
+
+    Rows are sent BW_SERVE_BATCH at a time over a pool of `connections` keep-alive
+    connections, as many requests in flight. The folders a batch needs that the vault
+    doesn't have yet are created first, together, so items can refer to their ids.
+    If an item fails, the rest of its batch is still awaited and the RuntimeError
+    raised says how many items were created. Nothing is written to disk;
+    buffer_size is unused.
+    """
+    pool = _ConnectionPool(out_path or BW_SERVE_URL, connections)
+    count = 0
+    try:
+        listed = pool.request("GET", "/list/object/folders")["data"]["data"]
+        # "No Folder" is listed with a null id
+        folder_ids = {f["name"]: f["id"] for f in listed if f.get("id")}
+        create_item = partial(pool.request, "POST", "/object/item")
+
+        def create_folder(name: str) -> dict:
+            return pool.request("POST", "/object/folder", {"name": name})
+
+        it = iter(bw_rows)
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            while True:
+                batch = list(islice(it, BW_SERVE_BATCH))
+                if not batch:
+                    break
+                new = list(dict.fromkeys(r[0] for r in batch if r[0] and r[0] not in folder_ids))
+                for name, created in zip(new, executor.map(create_folder, new)):
+                    folder_ids[name] = created["data"]["id"]
+                items = [bitwarden_json_item(bw_row, folder_ids) for bw_row in batch]
+                # Wait for the whole batch so the count covers every item that made it
+                futures = [executor.submit(create_item, item) for item in items]
+                failed = []
+                for bw_row, fut in zip(batch, futures):
+                    try:
+                        fut.result()
+                        count += 1
+                    except Exception as e:
+                        failed.append((bw_row[_NAME], e))
+                if failed:
+                    name, error = failed[0]
+                    raise RuntimeError(
+                        f"{count} item(s) created, {len(failed)} failed in the last batch "
+                        f"(first: {name!r}: {error})"
+                    ) from error
+    finally:
+        pool.close()
+    return count
+
+
+# Output writers by format name; each takes (bw_rows, out_path, buffer_size, **writer_options).
+WRITERS: dict[str, Callable[..., int]] = {
+    "csv": write_bitwarden,
+    "json": write_bitwarden_json,
+    "encrypted-json": write_bitwarden_encrypted_json,
+    "bw-serve": write_bw_serve,
+}
+
+
+# Bytes read from the start of a mapped input to sample rows for infer_fields().
+SAMPLE_BYTES = 64 * 1024
+
+
+def _record_end(buf, start: int, target: int) -> int:
+    """
+    Offset just past the first record-ending newline at or after target.
+
+    start must be the beginning of a record; quotes are counted from there so that
+    newlines inside quoted fields (multi-line notes) are not mistaken for record ends.
+    """
+    quotes = 0
+    pos = start
+    while True:
+        nl = buf.find(b"\n", max(target, pos))
+        if nl == -1:
+            return len(buf)
+        quotes += buf[pos:nl].count(b'"')
+        pos = nl + 1
+        if quotes % 2 == 0:
+            return pos
+
+
+def _map_block(data: bytes, headers: list[str], field_map: dict[str, str]) -> list[BwRow]:
+    """Bitwarden rows of the whole Apple records in data (UTF-8, without header)."""
+    reader = csv.reader(io.StringIO(data.decode("utf-8"), newline=""))
+    return list(map_to_bitwarden(chain([headers], reader), field_map))
+
+
+def _map_chunk(
+    in_path: str, start: int, end: int, headers: list[str], field_map: dict[str, str]
+) -> list[BwRow]:
+    with open(in_path, "rb") as f:
+        f.seek(start)
+        return _map_block(f.read(end - start), headers, field_map)
+
+
+def _mmap_header(mm) -> tuple[list[str], int]:
+    """Parse the header record of a mapped export; returns (headers, offset of first record)."""
+    header_end = _record_end(mm, 0, 0)
+    # Apple exports are often UTF-8 with BOM
+    header_text = mm[:header_end].decode("utf-8-sig")
+    headers = next(csv.reader(io.StringIO(header_text, newline="")), None)
+    if not headers:
+        raise ValueError("Input CSV has no header row.")
+    return headers, header_end
+
+
+def _record_blocks(mm, start: int, block_size: int) -> Iterator[tuple[int, int]]:
+    """Consecutive (start, end) byte ranges of about block_size, aligned on record boundaries."""
+    size = len(mm)
+    while start < size:
+        end = _record_end(mm, start, start + block_size)
+        yield start, end
+        start = end
+
+
+def _open_mmap(f) -> mmap.mmap:
+    if os.fstat(f.fileno()).st_size == 0:
+        # mmap can't map an empty file
+        raise ValueError("Input CSV has no header row.")
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_apple_rows_mmap(in_path: str, block_size: int = CHUNK_SIZE) -> Iterator[list[str]]:
+    """
+    Memory-mapped variant of iter_apple_rows(), with the same output.
+
+    The file is mapped rather than read through a buffered text layer: the BOM is
+    dropped once with the header, and the rest is decoded straight from the mapping
+    in record-aligned blocks of about block_size bytes, each decoded in one call.
+    """
+    with open(in_path, "rb") as f, _open_mmap(f) as mm:
+        headers, start = _mmap_header(mm)
+        yield headers
+        for start, end in _record_blocks(mm, start, block_size):
+            with memoryview(mm)[start:end] as block:
+                text = str(block, "utf-8")
+            yield from csv.reader(io.StringIO(text, newline=""))
+
+
+def _mmap_field_map(mm, headers: list[str], start: int) -> dict[str, str]:
+    """cached_field_map(headers), completed from rows sampled at offset start of mm."""
+    field_map = cached_field_map(headers)
+    if not all(key in field_map for key in INFERABLE_FIELDS):
+        sample_end = _record_end(mm, start, start + SAMPLE_BYTES)
+        sample = csv.reader(io.StringIO(mm[start:sample_end].decode("utf-8"), newline=""))
+        field_map = complete_field_map(headers, sample, field_map)
+    return field_map
+
+
+def iter_chunked_rows(
+    in_path: str,
+    jobs: int | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    field_map: dict[str, str] | None = None,
+) -> Iterator[BwRow]:
+    """
+    Parallel replacement for map_to_bitwarden(iter_apple_rows(in_path)).
+
+    The input is split into byte ranges of about chunk_size aligned on CSV record
+    boundaries; each range is mapped in a worker process with field_map, or the
+    field map resolved from the header (and the first rows, as in map_to_bitwarden()).
+    Rows are yielded in input order, with at most 2 * jobs chunks in flight.
+    """
+    workers = jobs or os.cpu_count() or 1
+    with open(in_path, "rb") as f, _open_mmap(f) as mm:
+        headers, start = _mmap_header(mm)
+        if field_map is None:
+            field_map = _mmap_field_map(mm, headers, start)
+        blocks = _record_blocks(mm, start, chunk_size)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending: deque = deque()
+            while True:
+                for start, end in islice(blocks, 2 * workers - len(pending)):
+                    pending.append(pool.submit(_map_chunk, in_path, start, end, headers, field_map))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
 
-        field_map = build_field_map(reader.fieldnames)
-
-        with open(out_path, "w", encoding="utf-8", newline="") as f_out:
-            writer = csv.DictWriter(f_out, fieldnames=BW_HEADER, extrasaction="ignore")
-            writer.writeheader()
-
-            for row in reader:
-                title = safe_strip(row.get(field_map.get("title", ""), ""))
-                url = safe_strip(row.get(field_map.get("url", ""), ""))
-                username = safe_strip(row.get(field_map.get("username", ""), ""))
-                password = safe_strip(row.get(field_map.get("password", ""), ""))
-                notes = safe_strip(row.get(field_map.get("notes", ""), ""))
-                totp = safe_strip(row.get(field_map.get("totp", ""), ""))
-                folder = safe_strip(row.get(field_map.get("folder", ""), ""))
-
-                favorite_raw = safe_strip(row.get(field_map.get("favorite", ""), ""))
-                favorite = to_bool_favorite(favorite_raw)
-
-                # If URL is empty but Title looks like a URL/domain, treat it as URL.
-                if not url and looks_like_url_or_domain(title):
-                    url = title
-
-                bw_row = {
-                    "folder": folder,
-                    "favorite": favorite,
-                    "type": "login",
-                    "name": guess_name(title, url),
-                    "notes": notes,
-                    "fields": "",
-                    "login_uri": url,
-                    "login_username": username,
-                    "login_password": password,
-                    "login_totp": totp,
-                }
-
-                # Skip completely empty rows
-                if any(bw_row[k] for k in ["name", "login_uri", "login_username", "login_password", "notes"]):
-                    writer.writerow(bw_row)
+
+def checkpoint_path(out_path: str) -> str:
+    """Sidecar file in which convert(checkpoint=True) records its progress."""
+    return out_path + ".checkpoint"
+
+
+def load_checkpoint(out_path: str) -> dict | None:
+    """Progress recorded for out_path by an interrupted conversion, or None."""
+    try:
+        with open(checkpoint_path(out_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(out_path: str, state: dict) -> None:
+    path = checkpoint_path(out_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _convert_checkpointed(
+    in_path: str,
+    out_path: str,
+    resume: bool,
+    write_buffer: int,
+    field_map: dict[str, str] | None,
+    checkpoint_bytes: int,
+) -> int:
+    with open(in_path, "rb") as f, _open_mmap(f) as mm:
+        headers, start = _mmap_header(mm)
+        signature = header_signature(headers)
+        state = load_checkpoint(out_path) if resume else None
+        if state is not None:
+            if state["input_size"] != len(mm) or state["header_signature"] != signature:
+                raise ValueError(
+                    f"{checkpoint_path(out_path)} was recorded for a different input; "
+                    "remove it to start over."
+                )
+            try:
+                out_size = os.path.getsize(out_path)
+            except FileNotFoundError:
+                out_size = -1
+            if out_size < state["output_offset"]:
+                raise ValueError(
+                    f"{out_path} is missing or shorter than {checkpoint_path(out_path)} "
+                    "records; remove the checkpoint to start over."
+                )
+            field_map = state["field_map"]
+            os.truncate(out_path, state["output_offset"])
+        else:
+            if field_map is None:
+                field_map = _mmap_field_map(mm, headers, start)
+            state = {
+                "input": os.path.abspath(in_path),
+                "input_size": len(mm),
+                "header_signature": signature,
+                "field_map": field_map,
+                "input_offset": start,
+                "rows": 0,
+                "output_offset": 0,
+            }
+
+        mode = "a" if state["output_offset"] else "w"
+        with open(out_path, mode, encoding="utf-8", newline="", buffering=write_buffer) as f_out:
+            writer = csv.writer(f_out)
+            if mode == "w":
+                writer.writerow(BW_HEADER)
+            for start, end in _record_blocks(mm, state["input_offset"], checkpoint_bytes):
+                bw_rows = _map_block(mm[start:end], headers, field_map)
+                writer.writerows(bw_rows)
+                # Output must be on disk before the checkpoint that points past it
+                f_out.flush()
+                os.fsync(f_out.fileno())
+                state.update(
+                    input_offset=end, rows=state["rows"] + len(bw_rows), output_offset=f_out.tell()
+                )
+                _save_checkpoint(out_path, state)
+
+    # An input without records never saves a checkpoint
+    with suppress(FileNotFoundError):
+        os.remove(checkpoint_path(out_path))
+    return state["rows"]
+
+
+def split_uris(login_uri: str) -> list[str]:
+    """URIs of a login_uri value; several URIs are newline-separated."""
+    return [u for u in login_uri.split("\n") if u]
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def login_fingerprint(bw_row: BwRow) -> bytes | None:
+    """
+    16-byte fingerprint of a login: normalised host (lowercase, no "www."),
+    lowercased username and password. Only the digest is kept in indexes.
+    None for rows without a password, which are never treated as duplicates.
+    """
+    if not bw_row[_PASSWORD]:
+        return None
+    uris = split_uris(bw_row[_URI])
+    host = _hostname(uris[0]).lower() if uris else ""
+    if host.startswith("www."):
+        host = host[4:]
+    return _digest("\0".join((host, bw_row[_USERNAME].lower(), bw_row[_PASSWORD])))
+
+
+def credential_fingerprint(bw_row: BwRow) -> bytes | None:
+    """
+    16-byte fingerprint of the credentials alone (lowercased username and password),
+    for grouping the sites that share them. None for rows without a password.
+    """
+    if not bw_row[_PASSWORD]:
+        return None
+    return _digest("\0".join((bw_row[_USERNAME].lower(), bw_row[_PASSWORD])))
+
+
+@contextmanager
+def _temp_db(max_memory: int) -> Iterator[sqlite3.Connection]:
+    # "" is a private temporary database: cached in memory up to cache_size,
+    # spilled to a temp file beyond it, deleted on close.
+    db = sqlite3.connect("")
+    try:
+        db.execute(f"PRAGMA cache_size = {-max(max_memory // 1024, 64)}")
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        yield db
+    finally:
+        db.close()
+
+
+class _GroupStore:
+    """Rows grouped by key for Deduper; several groups may share a key."""
+
+    def add(self, key: bytes, bw_row: BwRow) -> None:
+        raise NotImplementedError
+
+    def find(self, key: bytes) -> list[tuple[int, BwRow]]:
+        """(group id, row) of the groups with key, oldest first."""
+        raise NotImplementedError
+
+    def update(self, group_id: int, bw_row: BwRow) -> None:
+        raise NotImplementedError
+
+    def rows(self) -> Iterator[BwRow]:
+        """The row of every group, in the order groups were added."""
+        raise NotImplementedError
+
+
+class _MemoryGroupStore(_GroupStore):
+    def __init__(self) -> None:
+        self._rows: list[BwRow] = []
+        self._ids: dict[bytes, list[int]] = {}
+
+    def add(self, key: bytes, bw_row: BwRow) -> None:
+        self._ids.setdefault(key, []).append(len(self._rows))
+        self._rows.append(bw_row)
+
+    def find(self, key: bytes) -> list[tuple[int, BwRow]]:
+        return [(i, self._rows[i]) for i in self._ids.get(key, ())]
+
+    def update(self, group_id: int, bw_row: BwRow) -> None:
+        self._rows[group_id] = bw_row
+
+    def rows(self) -> Iterator[BwRow]:
+        return iter(self._rows)
+
+
+class _DiskGroupStore(_GroupStore):
+    def __init__(self, db: sqlite3.Connection) -> None:
+        # rowid follows insertion, so reading back by rowid keeps first-seen order
+        db.execute("CREATE TABLE groups (key BLOB NOT NULL, row TEXT NOT NULL)")
+        db.execute("CREATE INDEX groups_key ON groups (key)")
+        self._db = db
+        self._cur = db.cursor()
+
+    def add(self, key: bytes, bw_row: BwRow) -> None:
+        self._cur.execute("INSERT INTO groups (key, row) VALUES (?, ?)", (key, json.dumps(bw_row)))
+
+    def find(self, key: bytes) -> list[tuple[int, BwRow]]:
+        found = self._cur.execute(
+            "SELECT rowid, row FROM groups WHERE key = ? ORDER BY rowid", (key,)
+        ).fetchall()
+        return [(rowid, tuple(json.loads(row))) for rowid, row in found]
+
+    def update(self, group_id: int, bw_row: BwRow) -> None:
+        self._cur.execute(
+            "UPDATE groups SET row = ? WHERE rowid = ?", (json.dumps(bw_row), group_id)
+        )
+
+    def rows(self) -> Iterator[BwRow]:
+        for (row,) in self._db.execute("SELECT row FROM groups ORDER BY rowid"):
+            yield tuple(json.loads(row))
+
+
+class Deduper:
+    """
+    Pipeline stage for repeated logins: rows with the same key(row), by default
+    login_fingerprint(). Rows whose key is None are never duplicates.
+
+    Rows with the same key are only duplicates if their folder, notes and TOTP
+    agree or are empty on one side; a removed duplicate fills in the ones the kept
+    item lacks, so no TOTP secret or note is lost. Rows that disagree stay separate
+    items and are counted as conflicts.
+
+    Modes:
+    - "drop": keep the first occurrence of each login (with details filled in)
+    - "merge": as drop, also carrying the URIs of all its duplicates
+      (newline-separated login_uri)
+    - "report": pass every row, only count duplicates
+
+    In "drop" and "merge" the items are emitted in first-seen order once the input
+    is exhausted, since a later duplicate may still complete an earlier item.
+    Groups are kept in memory. With max_memory (bytes) they live in a temporary
+    SQLite database instead, whose page cache is capped at max_memory and which
+    spills to disk (in TMPDIR) beyond it, for exports that don't fit in RAM.
+    Counters and a few examples are available after the run through summary().
+
+    With key=credential_fingerprint and mode "merge" it groups every site that uses
+    the same username and password into one item with all their URIs, again only
+    where their folder, notes and TOTP agree.
+    """
+
+    MODES = ("drop", "merge", "report")
+
+    def __init__(
+        self,
+        mode: str = "drop",
+        max_examples: int = 20,
+        max_memory: int | None = None,
+        key: Callable[[BwRow], bytes | None] = login_fingerprint,
+        label: str = "dedupe",
+    ) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown dedupe mode: {mode!r} (expected one of {self.MODES})")
+        self.mode = mode
+        self.key = key
+        self.label = label
+        self.max_examples = max_examples
+        self.max_memory = max_memory
+        self.rows = 0
+        self.duplicates = 0
+        self.conflicts = 0
+        self.examples: list[tuple[str, str]] = []
+        self.conflict_examples: list[tuple[str, str]] = []
+
+    def __call__(self, bw_rows: Iterable[BwRow]) -> Iterator[BwRow]:
+        return self._group(bw_rows)
+
+    def _record(self, bw_row: BwRow) -> None:
+        self.duplicates += 1
+        if len(self.examples) < self.max_examples:
+            self.examples.append((bw_row[_NAME], bw_row[_USERNAME]))
+
+    @contextmanager
+    def _group_store(self) -> Iterator[_GroupStore]:
+        if self.max_memory is None:
+            yield _MemoryGroupStore()
+            return
+        with _temp_db(self.max_memory) as db:
+            yield _DiskGroupStore(db)
+
+    @staticmethod
+    def _with_uris(bw_row: BwRow, uris: list[str]) -> BwRow:
+        return bw_row[:_URI] + ("\n".join(uris),) + bw_row[_URI + 1 :]
+
+    def _join(self, kept: BwRow, bw_row: BwRow) -> BwRow | None:
+        """
+        kept with the empty details (folder, notes, TOTP) filled in from bw_row, and
+        in "merge" mode its URIs added; None if a detail differs between the two.
+        """
+        joined = list(kept)
+        for i in _DETAILS:
+            if not kept[i]:
+                joined[i] = bw_row[i]
+            elif bw_row[i] and bw_row[i] != kept[i]:
+                return None
+        if self.mode == "merge":
+            uris = split_uris(kept[_URI])
+            uris += [u for u in split_uris(bw_row[_URI]) if u not in uris]
+            joined[_URI] = "\n".join(uris)
+        return tuple(joined)
+
+    def _group(self, bw_rows: Iterable[BwRow]) -> Iterator[BwRow]:
+        report = self.mode == "report"
+        with self._group_store() as store:
+            for bw_row in bw_rows:
+                self.rows += 1
+                key = self.key(bw_row)
+                if key is None:
+                    if report:
+                        yield bw_row
+                    else:
+                        # A key no fingerprint can collide with (different length)
+                        store.add(self.rows.to_bytes(8, "big"), bw_row)
+                    continue
+                candidates = store.find(key)
+                for group_id, kept in candidates:
+                    joined = self._join(kept, bw_row)
+                    if joined is not None:
+                        self._record(bw_row)
+                        if joined != kept:
+                            store.update(group_id, joined)
+                        break
+                else:
+                    if candidates:
+                        self.conflicts += 1
+                        if len(self.conflict_examples) < self.max_examples:
+                            self.conflict_examples.append((bw_row[_NAME], candidates[0][1][_NAME]))
+                    store.add(key, bw_row)
+                if report:
+                    yield bw_row
+            if not report:
+                yield from store.rows()
+
+    def summary(self) -> str:
+        action = {"drop": "dropped", "merge": "merged", "report": "kept"}[self.mode]
+        index = "memory" if self.max_memory is None else "disk"
+        lines = [
+            f"{self.label}: {self.duplicates} duplicate(s) of {self.rows} rows {action} "
+            f"({index} index)"
+        ]
+        if self.conflicts:
+            lines.append(
+                f"  {self.conflicts} row(s) with a known key kept as separate items: "
+                "notes, TOTP or folder differ"
+            )
+        for name, other in self.conflict_examples:
+            lines.append(f"  conflict: {name!r} kept apart from {other!r}")
+        for name, username in self.examples:
+            lines.append(f"  duplicate: {name!r} ({username or 'no username'})")
+        if self.duplicates > len(self.examples):
+            lines.append(f"  ... and {self.duplicates - len(self.examples)} more")
+        return "\n".join(lines)
+
+
+def iter_vault_rows(path: str) -> Iterator[BwRow]:
+    """
+    Logins of an existing Bitwarden export (CSV, or unencrypted JSON if path ends
+    in .json) as Bitwarden rows, one row per URI so that each of an item's sites
+    gets its own login_fingerprint(). Non-login items are left out.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        if doc.get("encrypted"):
+            raise ValueError(f"{path}: encrypted export; export the vault as JSON or CSV.")
+        for item in doc.get("items", ()):
+            login = item.get("login")
+            if item.get("type") != 1 or not login:
+                continue
+            fields = ("", "", "login", item.get("name") or "", "", "")
+            creds = (login.get("username") or "", login.get("password") or "", "")
+            for uri in [u.get("uri") or "" for u in login.get("uris") or ()] or [""]:
+                yield fields + (uri,) + creds
+        return
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        # Bitwarden's own CSV export has extra columns (e.g. reprompt), so go by name
+        for rec in csv.DictReader(f):
+            if rec.get("type", "login") != "login":
+                continue
+            row = tuple(rec.get(k) or "" for k in BW_HEADER)
+            for uri in split_uris(row[_URI]) or [""]:
+                yield row[:_URI] + (uri,) + row[_URI + 1 :]
+
+
+def item_fingerprint(bw_row: BwRow) -> bytes:
+    """
+    login_fingerprint() of a row, or for rows without a password (notes, bare
+    bookmarks) a 16-byte digest of the whole row.
+    """
+    return login_fingerprint(bw_row) or _digest("\0".join(bw_row))
+
+
+def delta_index_path(out_path: str) -> str:
+    """Default fingerprint index kept next to out_path by DeltaFilter."""
+    return out_path + ".fingerprints"
+
+
+class DeltaFilter:
+    """
+    Pipeline stage that passes only items not emitted by a previous run.
+
+    index_path holds the item_fingerprint() of every item emitted so far, as
+    concatenated 16-byte digests. Rows whose fingerprint is in it (or repeats one
+    seen earlier in the run) are skipped; a login whose password changed has a new
+    fingerprint and passes. The index is loaded into a set when the stream starts;
+    new fingerprints are only kept in memory until commit() adds them to the index,
+    which convert() calls once the writer has finished. A failed or interrupted run
+    leaves the previous index untouched.
+    """
+
+    DIGEST_SIZE = 16
+
+    def __init__(self, index_path: str, label: str = "delta") -> None:
+        self.index_path = index_path
+        self.label = label
+        self.rows = 0
+        self.skipped = 0
+        self.known = 0
+        self._added: list[bytes] = []
+
+    def _load(self) -> set[bytes]:
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return set()
+        size = self.DIGEST_SIZE
+        if len(data) % size:
+            raise ValueError(f"{self.index_path}: not a fingerprint index (truncated?)")
+        return {data[i : i + size] for i in range(0, len(data), size)}
+
+    def __call__(self, bw_rows: Iterable[BwRow]) -> Iterator[BwRow]:
+        seen = self._load()
+        self.known = len(seen)
+        self._added = []
+        for bw_row in bw_rows:
+            self.rows += 1
+            key = item_fingerprint(bw_row)
+            if key in seen:
+                self.skipped += 1
+                continue
+            seen.add(key)
+            self._added.append(key)
+            yield bw_row
+
+    def commit(self) -> None:
+        """Add the fingerprints of the rows passed on to the index."""
+        # Append to a copy so the index is replaced in one step
+        tmp_path = self.index_path + ".tmp"
+        known = os.path.exists(self.index_path)
+        if known:
+            shutil.copyfile(self.index_path, tmp_path)
+        with open(tmp_path, "ab" if known else "wb") as f:
+            f.write(b"".join(self._added))
+        os.replace(tmp_path, self.index_path)
+        self._added = []
+
+    def summary(self) -> str:
+        return (
+            f"{self.label}: {self.skipped} of {self.rows} rows already emitted by a previous "
+            f"run skipped, {self.rows - self.skipped} new or changed "
+            f"(index: {self.index_path}, {self.known} known)"
+        )
+
+
+class VaultFilter:
+    """
+    Pipeline stage dropping logins that already exist in the target Bitwarden vault.
+
+    The login_fingerprint() of every login in vault_path (an existing Bitwarden CSV
+    or JSON export, read with iter_vault_rows()) is indexed when the stream starts;
+    rows with the same fingerprint are then skipped in a single pass. As with
+    Deduper, max_memory (bytes) moves the index into a temporary SQLite database
+    that spills to disk beyond it. Rows without a password always pass.
+    """
+
+    def __init__(
+        self,
+        vault_path: str,
+        max_memory: int | None = None,
+        max_examples: int = 20,
+        label: str = "skip-existing",
+    ) -> None:
+        self.vault_path = vault_path
+        self.max_memory = max_memory
+        self.max_examples = max_examples
+        self.label = label
+        self.rows = 0
+        self.skipped = 0
+        self.vault_logins = 0
+        self.examples: list[tuple[str, str]] = []
+
+    @contextmanager
+    def _index(self) -> Iterator[Callable[[bytes], bool]]:
+        """Yields contains(key) over the fingerprints of the vault's logins."""
+        keys = (k for k in map(login_fingerprint, iter_vault_rows(self.vault_path)) if k)
+        if self.max_memory is None:
+            index = set(keys)
+            self.vault_logins = len(index)
+            yield index.__contains__
+            return
+
+        with _temp_db(self.max_memory) as db:
+            db.execute("CREATE TABLE vault (key BLOB PRIMARY KEY) WITHOUT ROWID")
+            db.executemany("INSERT OR IGNORE INTO vault VALUES (?)", ((k,) for k in keys))
+            self.vault_logins = db.execute("SELECT count(*) FROM vault").fetchone()[0]
+            cur = db.cursor()
+
+            def contains_on_disk(key: bytes) -> bool:
+                found = cur.execute("SELECT 1 FROM vault WHERE key = ?", (key,)).fetchone()
+                return found is not None
+
+            yield contains_on_disk
+
+    def __call__(self, bw_rows: Iterable[BwRow]) -> Iterator[BwRow]:
+        with self._index() as contains:
+            for bw_row in bw_rows:
+                self.rows += 1
+                key = login_fingerprint(bw_row)
+                if key is not None and contains(key):
+                    self.skipped += 1
+                    if len(self.examples) < self.max_examples:
+                        self.examples.append((bw_row[_NAME], bw_row[_USERNAME]))
+                    continue
+                yield bw_row
+
+    def summary(self) -> str:
+        index = "memory" if self.max_memory is None else "disk"
+        lines = [
+            f"{self.label}: {self.skipped} of {self.rows} rows already in the vault skipped "
+            f"({self.vault_logins} vault logins, {index} index)"
+        ]
+        for name, username in self.examples:
+            lines.append(f"  in vault: {name!r} ({username or 'no username'})")
+        if self.skipped > len(self.examples):
+            lines.append(f"  ... and {self.skipped - len(self.examples)} more")
+        return "\n".join(lines)
+
+
+def _commit_stages(stages: Sequence[Stage]) -> None:
+    # Stages that persist state (DeltaFilter) do so only once the output is complete
+    for stage in stages:
+        commit = getattr(stage, "commit", None)
+        if commit is not None:
+            commit()
+
+
+def convert(
+    in_path: str,
+    out_path: str,
+    stages: Sequence[Stage] = (),
+    jobs: int | None = None,
+    use_mmap: bool = False,
+    write_buffer: int = -1,
+    out_format: str = "csv",
+    writer_options: dict | None = None,
+    field_map: dict[str, str] | None = None,
+    checkpoint: bool = False,
+    resume: bool = False,
+    checkpoint_bytes: int = CHECKPOINT_BYTES,
+) -> int:
+    """
+    Convert an Apple export at in_path to a Bitwarden CSV (or, with out_format="json",
+    Bitwarden JSON) at out_path.
+
+    Rows stream through iter_apple_rows -> map_to_bitwarden -> stages -> write_bitwarden,
+    so memory use does not grow with the size of the export. Each stage takes an
+    iterable of Bitwarden rows and returns an iterable of Bitwarden rows (e.g. a
+    generator that drops, rewrites or records rows); stages with a commit() method
+    have it called once the writer has returned.
+
+    With jobs > 1 the mapping runs in that many worker processes over record-aligned
+    chunks of the input (see iter_chunked_rows); stages and the writer still see the
+    rows in input order. use_mmap reads the input with iter_apple_rows_mmap();
+    write_buffer is the output buffer size passed to the writer, writer_options its
+    extra keyword arguments (e.g. the password of "encrypted-json"). field_map is an
+    explicit Apple field -> column mapping that replaces header detection.
+
+    With checkpoint=True the input is converted checkpoint_bytes at a time, and after
+    each block the input offset, rows written and output size are recorded in
+    checkpoint_path(out_path) (removed once done). resume=True continues from that
+    record if there is one: the output is cut back to the recorded size and reading
+    restarts at the recorded offset. Checkpointing is for plain CSV output without
+    stages or jobs, whose state couldn't be restored.
+
+    Returns the number of rows written (in total, when resuming).
+    """
+    if checkpoint or resume:
+        if stages or out_format != "csv" or (jobs is not None and jobs > 1):
+            raise ValueError("Checkpointing supports CSV output only, without stages or jobs.")
+        return _convert_checkpointed(
+            in_path, out_path, resume, write_buffer, field_map, checkpoint_bytes
+        )
+
+    bw_rows: Iterable[BwRow]
+    if jobs is not None and jobs > 1:
+        bw_rows = iter_chunked_rows(in_path, jobs, field_map=field_map)
+    elif use_mmap:
+        bw_rows = map_to_bitwarden(iter_apple_rows_mmap(in_path), field_map)
+    else:
+        bw_rows = map_to_bitwarden(iter_apple_rows(in_path), field_map)
+    for stage in stages:
+        bw_rows = stage(bw_rows)
+    count = WRITERS[out_format](bw_rows, out_path, write_buffer, **(writer_options or {}))
+    _commit_stages(stages)
+    return count
+
+
+def _last_record_end(buf) -> int:
+    """
+    Offset just past the last record-ending newline in buf, or 0 if buf holds no
+    complete record. buf must start at the beginning of a record (see _record_end()).
+    """
+    nl = buf.rfind(b"\n")
+    quotes = buf.count(b'"', 0, nl) if nl != -1 else 0
+    while nl != -1:
+        if quotes % 2 == 0:
+            return nl + 1
+        prev = buf.rfind(b"\n", 0, nl)
+        quotes -= buf.count(b'"', prev + 1, nl)
+        nl = prev
+    return 0
+
+
+def _convert_block(text: str, headers: list[str], field_map: dict[str, str]) -> bytes:
+    """Bitwarden CSV (without header) of the Apple records in text."""
+    out = io.StringIO()
+    rows = csv.reader(io.StringIO(text, newline=""))
+    csv.writer(out).writerows(map_to_bitwarden(chain([headers], rows), field_map))
+    return out.getvalue().encode("utf-8")
+
+
+async def aconvert(
+    chunks: AsyncIterable[bytes],
+    field_map: dict[str, str] | None = None,
+    executor: Executor | None = None,
+    block_size: int = ASYNC_BLOCK_SIZE,
+    max_pending: int = 2,
+) -> AsyncIterator[bytes]:
+    """
+    Asynchronous convert() for event loops: convert an Apple export arriving as an
+    async stream of byte chunks (e.g. an upload body) and yield the Bitwarden CSV
+    as byte chunks, the header first.
+
+    Chunks are collected into blocks of about block_size bytes cut on record
+    boundaries. Each block is decoded, mapped and formatted by _convert_block() in
+    executor (the loop's default thread pool if None; a ProcessPoolExecutor maps
+    blocks in parallel), with up to max_pending blocks in flight while more input
+    is read. Output keeps the input order. field_map is resolved as in
+    map_to_bitwarden() if not given, sampling the first block. Stages are not
+    supported: they need the whole row stream in one place.
+    """
+    loop = asyncio.get_running_loop()
+    buf = bytearray()
+    headers: list[str] | None = None
+    pending: deque = deque()
+
+    def read_header(end: int) -> bytes:
+        nonlocal headers
+        # Apple exports are often UTF-8 with BOM
+        headers = next(csv.reader(io.StringIO(buf[:end].decode("utf-8-sig"), newline="")), None)
+        if not headers:
+            raise ValueError("Input CSV has no header row.")
+        del buf[:end]
+        out = io.StringIO()
+        csv.writer(out).writerow(BW_HEADER)
+        return out.getvalue().encode("utf-8")
+
+    def submit(data: bytes) -> None:
+        nonlocal field_map
+        text = data.decode("utf-8")
+        if field_map is None:
+            sample = csv.reader(io.StringIO(text, newline=""))
+            field_map = complete_field_map(headers, sample, cached_field_map(headers))
+        pending.append(loop.run_in_executor(executor, _convert_block, text, headers, field_map))
+
+    async for chunk in chunks:
+        buf += chunk
+        if headers is None:
+            if not _last_record_end(buf):
+                continue
+            yield read_header(_record_end(buf, 0, 0))
+        if len(buf) >= block_size:
+            end = _last_record_end(buf)
+            if end:
+                submit(bytes(buf[:end]))
+                del buf[:end]
+        while pending and (pending[0].done() or len(pending) > max_pending):
+            yield await pending.popleft()
+
+    if headers is None:
+        yield read_header(len(buf))
+    if buf:
+        submit(bytes(buf))
+    while pending:
+        yield await pending.popleft()
+
+
+class BatchResult(NamedTuple):
+    in_path: str
+    out_path: str
+    rows: int
+    error: str
+    summaries: tuple[str, ...] = ()
+
+
+def expand_inputs(specs: Iterable[str]) -> list[str]:
+    """Expand input arguments: directories become their *.csv files, globs are expanded."""
+    paths: list[str] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths.extend(sorted(glob.glob(os.path.join(spec, "*.csv"))))
+        elif glob.has_magic(spec):
+            paths.extend(sorted(glob.glob(spec)))
+        else:
+            paths.append(spec)
+    return paths
+
+
+def batch_output_paths(in_paths: Sequence[str], out_dir: str, ext: str = "csv") -> list[str]:
+    """One output path per input: <out_dir>/<stem>-bitwarden.<ext>, suffixed on name clashes."""
+    used: set[str] = set()
+    out_paths = []
+    for p in in_paths:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        name = f"{stem}-bitwarden.{ext}"
+        n = 1
+        # A suffixed name can equal another input's own name (x.csv twice, x-2.csv);
+        # compared case-insensitively for case-insensitive filesystems
+        while name.lower() in used:
+            n += 1
+            name = f"{stem}-{n}-bitwarden.{ext}"
+        used.add(name.lower())
+        out_paths.append(os.path.join(out_dir, name))
+    return out_paths
+
+
+def _convert_job(in_path: str, out_path: str, options: dict) -> tuple[int, tuple[str, ...]]:
+    """
+    convert() one input in a worker; returns its row count and the summary() of each
+    stage, since the stages' counters stay in the worker process.
+    """
+    if not os.path.exists(in_path):
+        raise FileNotFoundError(f"Input file not found: {in_path}")
+    try:
+        rows = convert(in_path, out_path, **options)
+        return rows, tuple(stage.summary() for stage in options.get("stages", ()))
+    except Exception:
+        # Don't leave a half-written output behind for a failed input
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+
+
+def convert_batch(
+    in_paths: Sequence[str],
+    out_dir: str | None = None,
+    merge_path: str | None = None,
+    jobs: int | None = None,
+    out_format: str = "csv",
+    write_buffer: int = -1,
+    writer_options: dict | None = None,
+    stages: Sequence[Stage] = (),
+    **options,
+) -> list[BatchResult]:
+    """
+    Convert many Apple exports in parallel worker processes.
+
+    Writes one output per input into out_dir, or, with merge_path, a single Bitwarden
+    file holding the rows of every successfully converted input in input order.
+    A failing input does not stop the others; its error is recorded in the result.
+    stages run per input with out_dir (each result carries their summaries), and
+    once over the merged rows with merge_path.
+    Other keyword options are passed on to convert() for every input.
+    """
+    if (out_dir is None) == (merge_path is None):
+        raise ValueError("Pass exactly one of out_dir or merge_path.")
+    if out_format == "bw-serve":
+        # Inputs are converted to plaintext CSV parts before merging
+        raise ValueError("bw-serve is not supported in batch mode.")
+    if out_format == "encrypted-json" and merge_path is not None:
+        raise ValueError("encrypted-json can't be merged: the parts are staged as plaintext CSV.")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+            out_paths = batch_output_paths(in_paths, out_dir, out_format)
+            options.update(
+                out_format=out_format,
+                write_buffer=write_buffer,
+                writer_options=writer_options,
+                stages=stages,
+            )
+        else:
+            # Parts are always CSV; they are merged into out_format below
+            out_paths = [os.path.join(tmp_dir, f"part-{i}.csv") for i in range(len(in_paths))]
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(_convert_job, i, o, options) for i, o in zip(in_paths, out_paths)
+            ]
+
+        results = []
+        for in_path, out_path, fut in zip(in_paths, out_paths, futures):
+            try:
+                rows, summaries = fut.result()
+                results.append(BatchResult(in_path, out_path, rows, "", summaries))
+            except Exception as e:
+                results.append(BatchResult(in_path, out_path, 0, f"{type(e).__name__}: {e}"))
+
+        if merge_path is not None:
+            parts = [r.out_path for r in results if not r.error]
+            if out_format == "csv" and not stages:
+                with open(merge_path, "w", encoding="utf-8", newline="") as f_out:
+                    csv.writer(f_out).writerow(BW_HEADER)
+                with open(merge_path, "ab", buffering=write_buffer) as f_out:
+                    for part_path in parts:
+                        with open(part_path, "rb") as part:
+                            part.readline()  # header
+                            shutil.copyfileobj(part, f_out)
+            else:
+                bw_rows: Iterable[BwRow] = chain.from_iterable(iter_bitwarden_csv(p) for p in parts)
+                for stage in stages:
+                    bw_rows = stage(bw_rows)
+                WRITERS[out_format](bw_rows, merge_path, write_buffer, **(writer_options or {}))
+                _commit_stages(stages)
+            results = [r._replace(out_path=merge_path) for r in results]
+
+    return results
+
+
+def print_batch_summary(results: Sequence[BatchResult]) -> None:
+    failed = [r for r in results if r.error]
+    for r in results:
+        if r.error:
+            print(f"FAILED  {r.in_path}: {r.error}")
+        else:
+            print(f"ok      {r.in_path} -> {r.out_path} ({r.rows} rows)")
+            for summary in r.summaries:
+                for line in summary.splitlines():
+                    print(f"        {line}")
+    total = sum(r.rows for r in results)
+    print(f"{len(results) - len(failed)}/{len(results)} files converted, {total} rows converted")
+
+
+def parse_size(s: str) -> int:
+    """Parse a byte size such as "65536", "64K", "8M" or "1G" (binary units)."""
+    units = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+    m = re.fullmatch(r"\s*(\d+)\s*([KMG]?)B?\s*", s, re.I)
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid size: {s!r}")
+    return int(m.group(1)) * units[m.group(2).upper()]
+
+
+def parse_buffer_size(s: str) -> int:
+    """parse_size() for output buffers: text files need at least 2 bytes of buffer."""
+    size = parse_size(s)
+    if size < 2:
+        raise argparse.ArgumentTypeError(f"buffer size must be at least 2 bytes: {s!r}")
+    return size
+
+
+def read_password(env_var: str | None) -> str:
+    """Export password from env_var, or prompted for (twice) on the terminal."""
+    if env_var:
+        password = os.environ.get(env_var, "")
+        if not password:
+            raise SystemExit(f"Environment variable {env_var} is empty or not set.")
+        return password
+    password = getpass.getpass("Export password: ")
+    if not password:
+        raise SystemExit("Export password must not be empty.")
+    if getpass.getpass("Repeat export password: ") != password:
+        raise SystemExit("Passwords do not match.")
+    return password
+
+
+# Hot paths summarised by format_profile(): label -> functions of this module, or
+# built-in functions by their pstats name.
+PROFILE_GROUPS: dict[str, tuple[str, ...]] = {
+    "norm": ("norm",),
+    "safe_strip": ("safe_strip",),
+    "guess_name": ("guess_name",),
+    "looks_like_url_or_domain": ("looks_like_url_or_domain",),
+    "build_field_map": (
+        "build_field_map",
+        "match_fields",
+        "resolve_field_map",
+        "complete_field_map",
+    ),
+    "csv read": (
+        "iter_apple_rows",
+        "iter_apple_rows_mmap",
+        "_map_chunk",
+        "_map_block",
+        "_convert_block",
+    ),
+    "csv write": (
+        "<method 'writerow' of '_csv.writer' objects>",
+        "<method 'writerows' of '_csv.writer' objects>",
+    ),
+}
+
+
+def format_profile(stats: pstats.Stats) -> str:
+    """
+    Calls and time (including callees) of each PROFILE_GROUPS entry in stats.
+
+    Calls between functions of one group are counted once, at the group boundary.
+    Cache hits of norm() and of the hostname cache never reach the function, so
+    their (small) cost shows in the caller. "csv read" is the time spent in the
+    reader generators, i.e. reading and parsing the input; for inputs read in
+    blocks (--checkpoint, async) it also covers mapping the block's rows.
+    """
+    here = safe_strip.__code__.co_filename
+
+    def in_group(key: tuple, names: tuple[str, ...]) -> bool:
+        filename, _, name = key
+        return name in names and filename in (here, "~")
+
+    total = stats.total_tt
+    lines = [f"Profile: {total:.3f} s in total", f"  {'':<26} {'calls':>10} {'seconds':>9}  share"]
+    for label, names in PROFILE_GROUPS.items():
+        calls = 0
+        seconds = 0.0
+        for key, (_, _, _, _, callers) in stats.stats.items():
+            if not in_group(key, names):
+                continue
+            for caller, (nc, _, _, ct) in callers.items():
+                if not in_group(caller, names):
+                    calls += nc
+                    seconds += ct
+        share = 100.0 * seconds / total if total else 0.0
+        lines.append(f"  {label:<26} {calls:>10} {seconds:>9.3f} {share:5.1f}%")
+    return "\n".join(lines)
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(
         description="Convert Apple Passwords CSV export to Bitwarden CSV import format."
     )
-    ap.add_argument("input_csv", help="Path to Apple/iCloud exported CSV (e.g., password.csv)")
+    ap.add_argument(
+        "input_csv",
+        nargs="+",
+        help="Path to Apple/iCloud exported CSV (e.g., password.csv). "
+        "Several paths, directories or globs convert in batch mode.",
+    )
     ap.add_argument(
         "-o",
         "--output",
-        default="bitwarden.csv",
-        help="Output CSV path (default: bitwarden.csv)",
+        help="Output path, or merged output with --merge (default: bitwarden.csv); "
+        f"for bw-serve the API URL (default: {BW_SERVE_URL})",
+    )
+    ap.add_argument(
+        "--format",
+        choices=sorted(WRITERS),
+        help="Output format: Bitwarden CSV, Bitwarden JSON, password-protected Bitwarden "
+        "JSON, or items created directly through a running `bw serve` (default: from the "
+        "output: an http(s) URL is bw-serve, a .json extension json, else csv)",
+    )
+    ap.add_argument(
+        "--connections",
+        type=int,
+        default=4,
+        metavar="N",
+        help="bw-serve: parallel keep-alive connections to the API (default: 4)",
+    )
+    ap.add_argument(
+        "--password-env",
+        metavar="VAR",
+        help="encrypted-json: read the export password from this environment variable "
+        "instead of prompting",
+    )
+    ap.add_argument(
+        "--kdf-iterations",
+        type=int,
+        default=KDF_ITERATIONS,
+        help=f"encrypted-json: PBKDF2 iterations (default: {KDF_ITERATIONS})",
+    )
+    ap.add_argument(
+        "--output-dir",
+        help="Batch mode: write one <name>-bitwarden.<format> per input into this directory",
+    )
+    ap.add_argument(
+        "--merge",
+        action="store_true",
+        help="Batch mode: merge all inputs into the --output file",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes: across files in batch mode (default: CPU count), "
+        "or across chunks of a single large input (default: 1)",
+    )
+    ap.add_argument(
+        "--mapping-file",
+        metavar="PATH",
+        help="Explicit column mapping (JSON: field -> column). Used instead of header "
+        "detection if PATH exists, otherwise the detected mapping is saved there",
+    )
+    ap.add_argument(
+        "--show-mapping",
+        action="store_true",
+        help="Print how the columns of the (first) input were matched, with confidence",
+    )
+    ap.add_argument(
+        "--mapping-cache",
+        metavar="PATH",
+        help="JSON cache of detected column mappings by header signature; "
+        "new headers are added to it",
+    )
+    ap.add_argument(
+        "--dedupe",
+        choices=Deduper.MODES,
+        help="Find logins repeated with the same host, username and password: drop the "
+        "repeats, merge their URIs into one item, or only report them",
+    )
+    ap.add_argument(
+        "--group-uris",
+        action="store_true",
+        help="Collapse logins sharing username and password into one item with all their URIs",
+    )
+    ap.add_argument(
+        "--dedupe-memory",
+        type=parse_size,
+        metavar="SIZE",
+        help="Keep the --dedupe/--group-uris/--skip-existing indexes in a temporary SQLite "
+        "database using at most SIZE (e.g. 256M) of memory, spilling the rest to disk "
+        "in TMPDIR",
+    )
+    ap.add_argument(
+        "--skip-existing",
+        metavar="VAULT_EXPORT",
+        help="Leave out logins already in the target vault, given as a Bitwarden CSV or "
+        "JSON export of it",
+    )
+    ap.add_argument(
+        "--delta",
+        nargs="?",
+        const="",
+        metavar="INDEX",
+        help="Write only items that are new or changed since the previous --delta run, "
+        "tracked in a fingerprint index (default: <output>.fingerprints)",
+    )
+    ap.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Read the input through a memory map instead of buffered text I/O",
+    )
+    ap.add_argument(
+        "--write-buffer",
+        type=parse_buffer_size,
+        default=-1,
+        metavar="SIZE",
+        help="Output buffer size, e.g. 64K or 8M; helps on slow/network filesystems "
+        "(default: io default)",
+    )
+    ap.add_argument(
+        "--hostname-cache-size",
+        type=int,
+        default=HOSTNAME_CACHE_SIZE,
+        help=f"URLs whose hostname is cached, 0 to disable (default: {HOSTNAME_CACHE_SIZE})",
+    )
+    ap.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help=f"Record progress in <output>.checkpoint every {CHECKPOINT_BYTES // 2**20} MiB "
+        "of input so an interrupted conversion can be resumed (CSV output only)",
+    )
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted --checkpoint conversion of the same input and output",
+    )
+    ap.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print cache hit/miss statistics after converting",
+    )
+    ap.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Profile the conversion: write pstats data to PATH and a text report to "
+        "PATH.txt, and print the time spent in the main helpers (-j workers are "
+        "not profiled)",
     )
     args = ap.parse_args()
 
-    in_path = args.input_csv
+    if args.hostname_cache_size != HOSTNAME_CACHE_SIZE:
+        set_hostname_cache_size(args.hostname_cache_size)
+
+    out_format = args.format
+    if out_format is None:
+        if re.match(r"https?://", args.output or "", re.I):
+            out_format = "bw-serve"
+        elif (args.output or "").lower().endswith(".json"):
+            out_format = "json"
+        else:
+            out_format = "csv"
+    if args.output is None:
+        args.output = BW_SERVE_URL if out_format == "bw-serve" else "bitwarden.csv"
+
+    writer_options = None
+    if out_format == "encrypted-json":
+        try:
+            _load_aes()
+        except ImportError as e:
+            raise SystemExit(str(e))
+        writer_options = {
+            "password": read_password(args.password_env),
+            "kdf_iterations": args.kdf_iterations,
+        }
+    elif out_format == "bw-serve":
+        writer_options = {"connections": args.connections}
+
+    stages: list[Deduper | VaultFilter | DeltaFilter] = []
+    if args.skip_existing:
+        if not os.path.exists(args.skip_existing):
+            raise SystemExit(f"Vault export not found: {args.skip_existing}")
+        stages.append(VaultFilter(args.skip_existing, max_memory=args.dedupe_memory))
+    if args.dedupe:
+        stages.append(Deduper(args.dedupe, max_memory=args.dedupe_memory))
+    if args.group_uris:
+        stages.append(
+            Deduper(
+                "merge",
+                max_memory=args.dedupe_memory,
+                key=credential_fingerprint,
+                label="group-uris",
+            )
+        )
+    if args.delta is not None:
+        if args.output_dir:
+            raise SystemExit("--delta needs a single output; use --merge in batch mode.")
+        if out_format == "bw-serve" and not args.delta:
+            raise SystemExit("--delta with bw-serve needs an INDEX path.")
+        stages.append(DeltaFilter(args.delta or delta_index_path(args.output)))
+
+    in_paths = expand_inputs(args.input_csv)
+    if not in_paths:
+        raise SystemExit(f"No input files matched: {' '.join(args.input_csv)}")
+
+    if args.mapping_cache:
+        load_mapping_cache(args.mapping_cache)
+        # Resolve every header here: forked workers inherit the warm cache and the
+        # saved cache covers all inputs. Unreadable inputs are reported later.
+        for p in in_paths:
+            try:
+                cached_field_map(read_headers(p))
+            except (OSError, ValueError):
+                pass
+        save_mapping_cache(args.mapping_cache)
+
+    if args.show_mapping:
+        try:
+            headers, sample = read_sample(in_paths[0])
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"Cannot read the header of {in_paths[0]}: {e}")
+        matches = match_fields(headers)
+        matches += infer_fields(headers, sample, {m.field: m.header for m in matches})
+        print(f"Column mapping for {in_paths[0]}:")
+        print(format_field_matches(matches))
+
+    field_map = None
+    if args.mapping_file:
+        if os.path.exists(args.mapping_file):
+            try:
+                field_map = load_mapping_file(args.mapping_file)
+            except ValueError as e:
+                raise SystemExit(str(e))
+        else:
+            try:
+                headers, sample = read_sample(in_paths[0])
+                detected = complete_field_map(headers, sample, cached_field_map(headers))
+            except (OSError, ValueError) as e:
+                raise SystemExit(f"Cannot detect a mapping from {in_paths[0]}: {e}")
+            save_mapping_file(args.mapping_file, detected)
+            print(f"Saved detected mapping to {args.mapping_file}")
+
+    if args.output_dir or args.merge or len(in_paths) > 1:
+        if bool(args.output_dir) == args.merge:
+            raise SystemExit("Batch mode needs exactly one of --output-dir or --merge.")
+        if args.profile:
+            raise SystemExit("--profile profiles a single input.")
+        if out_format == "bw-serve":
+            raise SystemExit(
+                "bw-serve imports a single input; batch mode would stage plaintext CSV parts."
+            )
+        if args.checkpoint or args.resume:
+            raise SystemExit("--checkpoint/--resume convert a single input.")
+        if args.merge and out_format == "encrypted-json":
+            raise SystemExit(
+                "encrypted-json can't be merged (the parts would be staged as plaintext CSV); "
+                "use --output-dir for one encrypted file per input."
+            )
+        if args.stats:
+            # The caches live in the worker processes
+            raise SystemExit("--stats reports on a single input.")
+        results = convert_batch(
+            in_paths,
+            out_dir=args.output_dir,
+            merge_path=args.output if args.merge else None,
+            jobs=args.jobs,
+            out_format=out_format,
+            write_buffer=args.write_buffer,
+            writer_options=writer_options,
+            stages=stages,
+            field_map=field_map,
+            use_mmap=args.mmap,
+        )
+        print_batch_summary(results)
+        if args.merge:
+            for stage in stages:
+                print(stage.summary())
+        if any(r.error for r in results):
+            raise SystemExit(1)
+        return
+
+    in_path = in_paths[0]
     out_path = args.output
 
     if not os.path.exists(in_path):
         raise SystemExit(f"Input file not found: {in_path}")
 
-    convert(in_path, out_path)
-    print(f"Written: {out_path}")
+    if args.resume:
+        state = load_checkpoint(out_path)
+        if state is None:
+            print(f"No checkpoint for {out_path}; starting from the beginning.")
+        else:
+            print(
+                f"Resuming after {state['rows']} rows "
+                f"({state['input_offset']}/{state['input_size']} input bytes)."
+            )
+
+    run = partial(
+        convert,
+        in_path,
+        out_path,
+        stages=stages,
+        jobs=args.jobs,
+        use_mmap=args.mmap,
+        write_buffer=args.write_buffer,
+        out_format=out_format,
+        writer_options=writer_options,
+        field_map=field_map,
+        checkpoint=args.checkpoint,
+        resume=args.resume,
+    )
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        rows = profiler.runcall(run) if profiler else run()
+    except ValueError as e:
+        if not (args.checkpoint or args.resume or out_format == "bw-serve"):
+            raise
+        raise SystemExit(str(e))
+    except (OSError, RuntimeError) as e:
+        if out_format != "bw-serve":
+            raise
+        raise SystemExit(f"Import through bw serve at {out_path} failed: {e}")
+    if out_format == "bw-serve":
+        print(f"Created {rows} items through {out_path}")
+    else:
+        print(f"Written: {out_path}")
+    for stage in stages:
+        print(stage.summary())
+    if args.stats:
+        print(format_cache_stats())
+    if profiler:
+        profiler.dump_stats(args.profile)
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        summary = format_profile(stats)
+        report.write(summary + "\n\n")
+        stats.sort_stats("cumulative").print_stats(40)
+        with open(args.profile + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        print(summary)
+        print(f"Profile written to {args.profile} (report: {args.profile}.txt)")
 
 
 if __name__ == "__main__":